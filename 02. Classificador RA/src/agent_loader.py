@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import json
+import string
 from pathlib import Path
 from typing import Any, Dict
 
@@ -58,6 +59,35 @@ def format_message(template: str, **kwargs: Any) -> str:
     return template.format(**kwargs)
 
 
+def partial_format(template: str, **kwargs: Any) -> str:
+    """Fill in some placeholders and return a template for the rest.
+
+    Fields named in ``kwargs`` are substituted (with any braces in their
+    values escaped); every other field and escaped brace is kept, so the
+    result can be passed to :func:`format_message` later. Useful for binding
+    values that stay constant across many calls once.
+    """
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+
+        placeholder = "{" + field
+        if conversion:
+            placeholder += "!" + conversion
+        if spec:
+            placeholder += ":" + spec
+        placeholder += "}"
+
+        if field.split(".")[0].split("[")[0] in kwargs:
+            value = placeholder.format(**kwargs)
+            parts.append(value.replace("{", "{{").replace("}", "}}"))
+        else:
+            parts.append(placeholder)
+    return "".join(parts)
+
+
 def dump_agent_example(agent_config: Dict[str, Any]) -> str:
     """Return a compact JSON preview of an agent configuration (debug helper)."""
     return json.dumps(agent_config, indent=2, ensure_ascii=False)
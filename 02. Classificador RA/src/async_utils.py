@@ -0,0 +1,26 @@
+"""Helpers for running the async pipeline from synchronous code."""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+
+def run_sync(coro: Coroutine[Any, Any, T], async_method: str) -> T:
+    """Run ``coro`` to completion with ``asyncio.run``
+
+    ``asyncio.run`` cannot start while an event loop is already running (as in
+    Jupyter), so in that case the coroutine is discarded and the caller is
+    told to ``await`` ``async_method`` instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    coro.close()
+    raise RuntimeError(
+        f"An event loop is already running (e.g. in Jupyter); "
+        f"use `await {async_method}(...)` instead."
+    )
@@ -0,0 +1,168 @@
+"""Helpers to run chat completions through the OpenAI Batch API.
+
+Batch jobs cost 50% of the real-time price and have no per-minute rate limits,
+but results arrive asynchronously (within 24h), so they suit offline runs only.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch API limits per input file (larger jobs are split into several batches)
+BATCH_MAX_REQUESTS = 50_000
+BATCH_MAX_FILE_BYTES = 200 * 1024 * 1024
+
+# Batch statuses after which polling stops
+_FINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+
+def _batch_line(custom_id: str, body: Dict, endpoint: str) -> bytes:
+    """One request of a Batch API input file"""
+    return (
+        orjson.dumps(
+            {"custom_id": custom_id, "method": "POST", "url": endpoint, "body": body}
+        )
+        + b"\n"
+    )
+
+
+def build_batch_file(
+    requests: Iterable[Tuple[str, Dict]], endpoint: str = BATCH_ENDPOINT
+) -> bytes:
+    """Serialize ``(custom_id, body)`` pairs into the Batch API JSONL input format"""
+    return b"".join(
+        _batch_line(custom_id, body, endpoint) for custom_id, body in requests
+    )
+
+
+def split_batch_files(
+    requests: Iterable[Tuple[str, Dict]],
+    endpoint: str = BATCH_ENDPOINT,
+    max_requests: int = BATCH_MAX_REQUESTS,
+    max_bytes: int = BATCH_MAX_FILE_BYTES,
+) -> List[Tuple[List[str], bytes]]:
+    """Serialize requests into input files within the Batch API limits
+
+    Returns one ``(custom_ids, jsonl)`` pair per file.
+    """
+    files: List[Tuple[List[str], bytes]] = []
+    custom_ids: List[str] = []
+    lines: List[bytes] = []
+    size = 0
+    for custom_id, body in requests:
+        line = _batch_line(custom_id, body, endpoint)
+        if lines and (len(lines) >= max_requests or size + len(line) > max_bytes):
+            files.append((custom_ids, b"".join(lines)))
+            custom_ids, lines, size = [], [], 0
+        custom_ids.append(custom_id)
+        lines.append(line)
+        size += len(line)
+    if lines:
+        files.append((custom_ids, b"".join(lines)))
+    return files
+
+
+def parse_batch_output(content: bytes) -> Dict[str, Optional[Dict]]:
+    """Map each ``custom_id`` of a batch output/error file to its response body
+
+    Requests that did not succeed map to None.
+    """
+    results: Dict[str, Optional[Dict]] = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        response = item.get("response") or {}
+        results[item["custom_id"]] = (
+            response.get("body") if response.get("status_code") == 200 else None
+        )
+    return results
+
+
+async def wait_for_batch(
+    client, batch_id: str, poll_interval: float = 10, max_poll_interval: float = 300
+):
+    """Poll a batch until it reaches a final status, backing off exponentially"""
+    delay = poll_interval
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in _FINAL_STATUSES:
+            return batch
+
+        counts = batch.request_counts
+        progress = f" ({counts.completed}/{counts.total} done)" if counts else ""
+        print(f"  Batch {batch_id}: {batch.status}{progress}")
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_poll_interval)
+
+
+async def _run_batch_file(
+    client,
+    input_jsonl: bytes,
+    endpoint: str,
+    poll_interval: float,
+    max_poll_interval: float,
+) -> Dict[str, Optional[Dict]]:
+    """Submit one input file as a batch job, wait for it and return bodies by custom_id
+
+    Raises RuntimeError if the batch fails, expires or is cancelled.
+    """
+    input_file = await client.files.create(
+        file=("batch_input.jsonl", input_jsonl),
+        purpose="batch",
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id, endpoint=endpoint, completion_window="24h"
+    )
+    print(f"✓ Submitted batch {batch.id} (results within 24h)")
+
+    batch = await wait_for_batch(client, batch.id, poll_interval, max_poll_interval)
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+
+    # Failed requests are listed in the error file, successful ones in the output file
+    results: Dict[str, Optional[Dict]] = {}
+    for file_id in (batch.error_file_id, batch.output_file_id):
+        if file_id:
+            content = await client.files.content(file_id)
+            results.update(parse_batch_output(content.content))
+    return results
+
+
+async def run_batch(
+    client,
+    requests: Iterable[Tuple[str, Dict]],
+    endpoint: str = BATCH_ENDPOINT,
+    poll_interval: float = 10,
+    max_poll_interval: float = 300,
+) -> Dict[str, Optional[Dict]]:
+    """Submit requests as batch jobs, wait for them and return bodies by custom_id
+
+    ``client`` is an ``AsyncOpenAI`` instance. Requests beyond the per-file
+    limits go to further batches, run concurrently. A batch that fails,
+    expires or is cancelled maps its requests to None without discarding the
+    results of the others.
+    """
+    files = split_batch_files(requests, endpoint)
+    outcomes = await asyncio.gather(
+        *[
+            _run_batch_file(client, input_jsonl, endpoint, poll_interval, max_poll_interval)
+            for _, input_jsonl in files
+        ],
+        return_exceptions=True,
+    )
+
+    results: Dict[str, Optional[Dict]] = {}
+    for (custom_ids, _), outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Warning: {outcome}; {len(custom_ids)} requests marked as failed")
+            results.update(dict.fromkeys(custom_ids))
+        else:
+            results.update(outcome)
+    return results
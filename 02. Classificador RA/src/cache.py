@@ -0,0 +1,130 @@
+"""Caches for OpenAI responses: exact prompt-hash matches and semantic matches."""
+from __future__ import annotations
+
+import hashlib
+import os
+from collections import OrderedDict
+from typing import List, Optional
+
+import diskcache
+import numpy as np
+import orjson
+
+
+def make_cache_key(model: str, system_prompt: str, user_prompt: str) -> str:
+    """Hash everything that determines the model's answer into a cache key"""
+    payload = (model + system_prompt + user_prompt).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache: hot entries in memory, everything persisted on disk.
+
+    Keys are produced by :func:`make_cache_key`, so a change in model, system
+    prompt or user prompt (including the taxonomy) is always a cache miss.
+    """
+
+    def __init__(self, directory: str, max_memory_items: int = 10_000):
+        self._disk = diskcache.Cache(directory)
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self.max_memory_items = max_memory_items
+
+    def _remember(self, key: str, value: str):
+        """Insert into the memory tier, evicting the least recently used entry"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for ``key`` or None on a miss"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        value = self._disk.get(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        """Store ``value`` in both tiers"""
+        self._disk.set(key, value)
+        self._remember(key, value)
+
+    def close(self):
+        """Flush and close the disk tier"""
+        self._disk.close()
+
+
+class SemanticCache:
+    """Reuse answers for near-duplicate texts via embedding cosine similarity.
+
+    Embeddings are L2-normalised and stacked into one ``(N, dim)`` matrix, so a
+    lookup is a single matrix-vector product. The index is persisted as
+    ``embeddings.npy`` plus ``values.json`` inside ``directory``; callers should
+    scope the directory to everything the cached values depend on (e.g. model
+    and taxonomy).
+    """
+
+    def __init__(self, directory: str, threshold: float = 0.92):
+        self.directory = directory
+        self.threshold = threshold
+        self._embeddings_file = os.path.join(directory, "embeddings.npy")
+        self._values_file = os.path.join(directory, "values.json")
+
+        self.embeddings: Optional[np.ndarray] = None
+        self.values: List[str] = []
+        self._load()
+
+    def _load(self):
+        """Load a previously saved index, if any"""
+        if os.path.exists(self._embeddings_file) and os.path.exists(self._values_file):
+            self.embeddings = np.load(self._embeddings_file)
+            with open(self._values_file, "rb") as f:
+                self.values = orjson.loads(f.read())
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def lookup(self, embeddings: List[List[float]]) -> List[Optional[str]]:
+        """Return the cached value of the most similar entry for each embedding
+
+        Entries below the similarity threshold come back as None.
+        """
+        if self.embeddings is None or not len(embeddings):
+            return [None] * len(embeddings)
+
+        queries = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        similarities = queries @ self.embeddings.T
+        best = similarities.argmax(axis=1)
+        best_scores = similarities[np.arange(len(best)), best]
+
+        return [
+            self.values[idx] if score >= self.threshold else None
+            for idx, score in zip(best, best_scores)
+        ]
+
+    def add(self, embeddings: List[List[float]], values: List[str]):
+        """Append new entries to the in-memory index"""
+        if not values:
+            return
+
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        if self.embeddings is None:
+            self.embeddings = vectors
+        else:
+            self.embeddings = np.vstack([self.embeddings, vectors])
+        self.values.extend(values)
+
+    def save(self):
+        """Persist the index to disk"""
+        if self.embeddings is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(self._embeddings_file, self.embeddings)
+        with open(self._values_file, "wb") as f:
+            f.write(orjson.dumps(self.values))
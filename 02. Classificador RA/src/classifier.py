@@ -1,12 +1,61 @@
-import json
+import asyncio
 import os
 import time
-from typing import List, Dict, Optional
-from openai import OpenAI
+from collections import Counter
+from itertools import chain, islice
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+import ijson
+import orjson
+import tiktoken
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 from tqdm import tqdm
 import config
+from batch_api import run_batch
+from cache import ResponseCache, SemanticCache, make_cache_key
+from openai_client import create_async_client
+from aiolimiter import AsyncLimiter
+from async_utils import run_sync
 from usage_tracker import OpenAIUsageTracker
-from agent_loader import load_agent_config, format_message
+from agent_loader import load_agent_config, format_message, partial_format
+
+
+# Errors worth retrying: rate limits, timeouts, network and 5xx failures
+TRANSIENT_ERRORS = (
+    RateLimitError,
+    APITimeoutError,
+    APIConnectionError,
+    InternalServerError,
+)
+
+
+def _log_retry(retry_state):
+    """Report a retried API call to the classifier's usage tracker"""
+    classifier = retry_state.args[0]
+    error = retry_state.outcome.exception()
+    print(f"Retrying OpenAI call (attempt {retry_state.attempt_number}): {error}")
+    if classifier.tracker:
+        classifier.tracker.log_retry()
+
+
+# Retry transient errors with exponential backoff; anything else propagates
+_retry_transient = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    before_sleep=_log_retry,
+    reraise=True,
+)
 
 
 class ComplaintClassifier:
@@ -18,9 +67,26 @@ class ComplaintClassifier:
         model: Optional[str] = None,
         track_usage: bool = True,
         agent_name: str = "complaint_classifier",
+        max_concurrent_requests: int = config.MAX_CONCURRENT_REQUESTS,
+        max_rpm: int = config.MAX_REQUESTS_PER_MINUTE,
+        max_tpm: int = config.MAX_TOKENS_PER_MINUTE,
+        use_cache: bool = config.USE_RESPONSE_CACHE,
+        use_semantic_cache: bool = config.USE_SEMANTIC_CACHE,
     ):
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=api_key)
+        # Async OpenAI client (requests are fanned out concurrently over one
+        # HTTP/2 pool). Its pool binds to one event loop, so each run opens its
+        # own (see _new_client)
+        self.api_key = api_key
+        self.client = None
+
+        # Upper bound on in-flight API requests
+        self.max_concurrent_requests = max_concurrent_requests
+
+        # Keep throughput under the account's requests/min and tokens/min limits
+        # (aiolimiter binds to one event loop, so each run builds its own)
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self._new_limiters()
         
         # Load agent configuration from YAML file
         self.agent_config = load_agent_config(agent_name)
@@ -33,18 +99,39 @@ class ComplaintClassifier:
         self.parameters = self.agent_config.get("parameters", {})
         self.messages = self.agent_config.get("messages", {})
         
-        # Will hold the taxonomy during classification
+        # Will hold the taxonomy (and its prompt rendering) during classification
         self.taxonomy = None
+        self._taxonomy_text = ""
+        self._valid_categories = frozenset()
+        self._single_template = None
+        self._batch_template = None
+        self._batch_response_format = None
+
+        # Tokenizer used to estimate prompt size for the rate limiter
+        try:
+            self._encoding = tiktoken.encoding_for_model(self.model)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("o200k_base")
         
         # Optional: track API usage for cost monitoring
         self.tracker = (
             OpenAIUsageTracker(config.API_USAGE_LOG_FILE) if track_usage else None
         )
 
+        # Optional: reuse categories of previously classified complaints
+        self.cache = (
+            ResponseCache(os.path.join(config.CACHE_DIR, "classifier"))
+            if use_cache
+            else None
+        )
+
+        # Optional: reuse categories of near-duplicate complaints (embeddings)
+        self.use_semantic_cache = use_semantic_cache
+
     def load_taxonomy(self, file_path: str) -> List[Dict]:
         """Load curated taxonomy from JSON file"""
-        with open(file_path, "r", encoding="utf-8") as f:
-            taxonomy_data = json.load(f)
+        with open(file_path, "rb") as f:
+            taxonomy_data = orjson.loads(f.read())
 
         if isinstance(taxonomy_data, dict) and "proposed_categories" in taxonomy_data:
             return taxonomy_data["proposed_categories"]
@@ -55,214 +142,785 @@ class ComplaintClassifier:
                 "Invalid taxonomy format. Expected list of categories or dict with 'proposed_categories' key."
             )
 
-    def load_complaints(self, file_path: str) -> List[Dict]:
-        """Load complaints from JSON file"""
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+    def load_complaints(self, file_path: str) -> Iterator[Dict]:
+        """Stream complaints one by one from a JSON array file"""
+        with open(file_path, "rb") as f:
+            yield from ijson.items(f, "item")
 
-    def classify_complaint(self, complaint: Dict, taxonomy: List[Dict]) -> str:
-        """Classify a single complaint using OpenAI API"""
+    def _new_client(self):
+        """Open a fresh OpenAI client for this event loop
 
-        # Format taxonomy as readable text for the LLM
-        taxonomy_text = "\n".join(
-            [
-                f"- {cat['category_name']}: {cat['category_description']}"
-                for cat in taxonomy
-            ]
+        Retries are handled by _chat_completion, so the SDK's own are disabled.
+        Close it with ``await self.client.close()`` when the run ends.
+        """
+        self.client = create_async_client(self.api_key, max_retries=0)
+
+    def _new_limiters(self):
+        """Create fresh requests/min and tokens/min limiters for this event loop"""
+        self.request_limiter = AsyncLimiter(self.max_rpm, time_period=60)
+        self.token_limiter = AsyncLimiter(self.max_tpm, time_period=60)
+
+    @_retry_transient
+    async def _chat_completion(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        response_format: Optional[Dict] = None,
+        estimated_tokens: Optional[int] = None,
+    ):
+        """Send one chat completion request through the rate limiter and track usage
+
+        ``response_format`` is passed through to the API (e.g. a JSON schema).
+        ``estimated_tokens`` skips re-encoding a prompt whose size the caller
+        already knows.
+        Transient errors (429, 5xx, timeouts, connection drops) are retried with
+        exponential backoff; anything else propagates to the caller.
+        """
+
+        # Reserve rate-limit capacity for the estimated prompt size
+        if estimated_tokens is None:
+            estimated_tokens = len(self._encoding.encode(system_prompt)) + len(
+                self._encoding.encode(user_prompt)
+            )
+        await self.request_limiter.acquire()
+        # A single request larger than the bucket would otherwise never fit
+        await self.token_limiter.acquire(min(estimated_tokens, self.max_tpm))
+
+        start_time = time.time()
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **({"response_format": response_format} if response_format else {}),
         )
+        duration = time.time() - start_time
 
-        # Format complaint for the LLM
-        complaint_text = f"Title: {complaint.get('complaint_title', '')}\nText: {complaint.get('complaint_text', '')}"
+        # Track API usage if enabled
+        if self.tracker:
+            self.tracker.log_call(
+                input_tokens=response.usage.prompt_tokens,
+                output_tokens=response.usage.completion_tokens,
+                duration=duration,
+                estimated_input_tokens=estimated_tokens,
+            )
+
+        return response
+
+    def _set_taxonomy(self, taxonomy: List[Dict]):
+        """Store the taxonomy and precompute what every request needs from it"""
+        self.taxonomy = taxonomy
+
+        # Format taxonomy as readable text for the LLM (once per run)
+        self._taxonomy_text = "\n".join(
+            f"- {cat['category_name']}: {cat['category_description']}"
+            for cat in taxonomy
+        )
+        self._valid_categories = frozenset(cat["category_name"] for cat in taxonomy)
+
+        # The taxonomy is constant for the run: bind it into the templates once,
+        # leaving only the complaint placeholder to fill per request
+        self._single_template = self.messages.get("single_user_template")
+        if self._single_template:
+            self._single_template = partial_format(
+                self._single_template, taxonomy_text=self._taxonomy_text
+            )
+        self._batch_template = self.messages.get("batch_user_template")
+        if self._batch_template:
+            self._batch_template = partial_format(
+                self._batch_template, taxonomy_text=self._taxonomy_text
+            )
+
+        # Structured output for batch mode: the API guarantees JSON matching
+        # this schema, with categories restricted to the taxonomy (plus OTHER).
+        # Other models get plain JSON mode, checked when the answer is parsed
+        if self.model in config.STRUCTURED_OUTPUT_MODELS:
+            category_names = [cat["category_name"] for cat in taxonomy]
+            if "OTHER" not in self._valid_categories:
+                category_names.append("OTHER")
+            self._batch_response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "batch_results",
+                    "strict": True,
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "results": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "complaint_id": {"type": "string"},
+                                        "assigned_category": {
+                                            "type": "string",
+                                            "enum": category_names,
+                                        },
+                                    },
+                                    "required": ["complaint_id", "assigned_category"],
+                                    "additionalProperties": False,
+                                },
+                            }
+                        },
+                        "required": ["results"],
+                        "additionalProperties": False,
+                    },
+                },
+            }
+        else:
+            self._batch_response_format = {"type": "json_object"}
+
+    def _single_prompts(self, complaint: Dict) -> Tuple[str, str]:
+        """Build the (system, user) prompts used to classify a single complaint"""
+
+        complaint_text = self._complaint_text(complaint)
 
         # Load prompts from YAML config
         system_prompt = self.messages.get(
             "system",
             "You are a complaint classification system. Return only the category name.",
         )
-        user_template = self.messages.get("single_user_template")
-        if not user_template:
+        if not self._single_template:
             raise ValueError(
                 "Complaint classifier agent must define a single_user_template message."
             )
 
-        # Insert taxonomy and complaint into the prompt template
-        user_prompt = format_message(
-            user_template,
-            taxonomy_text=taxonomy_text,
-            complaint_text=complaint_text,
+        # Insert the complaint into the taxonomy-bound prompt template
+        user_prompt = format_message(self._single_template, complaint_text=complaint_text)
+        return system_prompt, user_prompt
+
+    def _complaint_text(self, complaint: Dict) -> str:
+        """Format complaint for the LLM"""
+        return f"Title: {complaint.get('complaint_title', '')}\nText: {complaint.get('complaint_text', '')}"
+
+    def _cache_key(self, complaint: Dict) -> str:
+        """Cache key for a complaint, shared by single and batch mode"""
+        return make_cache_key(self.model, *self._single_prompts(complaint))
+
+    @_retry_transient
+    async def _embed_batch(self, texts: List[str], estimated_tokens: int):
+        """Send one embeddings request through the rate limiter and track usage"""
+        await self.request_limiter.acquire()
+        await self.token_limiter.acquire(min(estimated_tokens, self.max_tpm))
+
+        start_time = time.time()
+        response = await self.client.embeddings.create(
+            model=config.EMBEDDING_MODEL, input=texts
         )
+        duration = time.time() - start_time
+
+        if self.tracker:
+            self.tracker.log_call(
+                input_tokens=response.usage.prompt_tokens,
+                output_tokens=0,
+                duration=duration,
+                estimated_input_tokens=estimated_tokens,
+                model=config.EMBEDDING_MODEL,
+            )
+
+        return response
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the OpenAI embeddings API, 100 texts per request
+
+        Each text is cut to ``EMBEDDING_MAX_TOKENS`` first, so one over-long
+        complaint cannot fail the whole request.
+        """
+        inputs, token_counts = [], []
+        for text in texts:
+            tokens = self._encoding.encode(text)
+            if len(tokens) > config.EMBEDDING_MAX_TOKENS:
+                tokens = tokens[: config.EMBEDDING_MAX_TOKENS]
+                text = self._encoding.decode(tokens)
+            inputs.append(text)
+            token_counts.append(len(tokens))
+
+        step = config.EMBEDDING_BATCH_SIZE
+        responses = await asyncio.gather(
+            *[
+                self._embed_batch(inputs[i : i + step], sum(token_counts[i : i + step]))
+                for i in range(0, len(inputs), step)
+            ]
+        )
+        return [item.embedding for response in responses for item in response.data]
+
+    def _semantic_cache_for_taxonomy(self) -> SemanticCache:
+        """Semantic index scoped to the current model and taxonomy"""
+        scope = make_cache_key(self.model, "", self._taxonomy_text)[:16]
+        return SemanticCache(
+            os.path.join(config.CACHE_DIR, "semantic", scope),
+            threshold=config.SEMANTIC_CACHE_THRESHOLD,
+        )
+
+    def _single_parameters(self) -> Tuple[float, int]:
+        """(temperature, max_tokens) used to classify a single complaint"""
+        temperature = self.parameters.get(
+            "single_temperature", self.parameters.get("temperature", 0.2)
+        )
+        max_tokens = self.parameters.get(
+            "single_max_tokens", self.parameters.get("max_tokens", 500)
+        )
+        return temperature, max_tokens
+
+    def _validate_category(self, category: str, complaint_id: str) -> str:
+        """Return the category if it exists in the taxonomy, OTHER otherwise"""
+        if category not in self._valid_categories:
+            print(
+                f"Warning: API returned invalid category '{category}' for {complaint_id}, defaulting to OTHER"
+            )
+            return "OTHER"
+        return category
+
+    async def _classify_one(self, complaint: Dict) -> str:
+        """Classify a single complaint using OpenAI API"""
+        system_prompt, user_prompt = self._single_prompts(complaint)
+        temperature, max_tokens = self._single_parameters()
 
         try:
             # Call OpenAI API for classification
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=self.parameters.get(
-                    "single_temperature", self.parameters.get("temperature", 0.2)
-                ),
-                max_tokens=self.parameters.get(
-                    "single_max_tokens", self.parameters.get("max_tokens", 500)
-                ),
+            response = await self._chat_completion(
+                system_prompt, user_prompt, temperature=temperature, max_tokens=max_tokens
             )
 
             category = response.choices[0].message.content.strip()
 
             # Validate that the returned category exists in taxonomy
-            valid_categories = [cat["category_name"] for cat in taxonomy]
-            if category not in valid_categories:
-                print(
-                    f"Warning: API returned invalid category '{category}' for {complaint['complaint_id']}, defaulting to OTHER"
-                )
-                return "OTHER"
-
-            return category
+            return self._validate_category(category, complaint["complaint_id"])
 
+        except RateLimitError:
+            # Still rate limited after retries: let the worker re-queue it
+            raise
         except Exception as e:
             print(f"Error classifying {complaint['complaint_id']}: {e}")
             return "ERROR"
 
-    def classify_batch(
-        self, complaints: List[Dict], batch_size: int = 10
-    ) -> List[Dict]:
-        """Classify multiple complaints in batches using OpenAI API"""
+    async def _classify_individually(self, complaints: List[Dict]) -> List[Dict]:
+        """Classify complaints one API call each (fallback for failed batches)"""
+        categories = await asyncio.gather(*[self._classify_one(c) for c in complaints])
+        return [
+            {"complaint_id": c["complaint_id"], "assigned_category": category}
+            for c, category in zip(complaints, categories)
+        ]
 
-        # Format taxonomy once for all batches
-        taxonomy_text = "\n".join(
-            [
-                f"- {cat['category_name']}: {cat['category_description']}"
-                for cat in self.taxonomy
-            ]
+    def _batch_entry(self, complaint: Dict) -> Tuple[str, int]:
+        """Format a complaint for a batch prompt; returns (text, token count)
+
+        The complaint text is cut at a token boundary (``COMPLAINT_MAX_TOKENS``)
+        rather than by characters, so accented Portuguese text gets the same
+        budget as plain ASCII.
+        """
+        header = f"ID: {complaint['complaint_id']}\nTitle: {complaint.get('complaint_title', '')}\nText: "
+        text_tokens = self._encoding.encode(complaint.get("complaint_text", ""))
+        text_tokens = text_tokens[: config.COMPLAINT_MAX_TOKENS]
+        entry = header + self._encoding.decode(text_tokens)
+        return entry, len(self._encoding.encode(header)) + len(text_tokens)
+
+    def _batch_system_prompt(self) -> str:
+        """System prompt for batch classification (from YAML config)"""
+        return self.messages.get(
+            "system",
+            "You are a complaint classification system. Return only valid JSON.",
         )
 
-        results = []
+    def _batch_max_tokens(self) -> int:
+        """Output token budget for one batch call"""
+        return self.parameters.get("max_tokens", 1000)
+
+    def _batch_limits(self) -> Tuple[int, int, int]:
+        """(fixed prompt tokens, complaint tokens, complaints) for one batch
+
+        The fixed part is the system prompt plus the user template, sent with
+        every batch.
+
+        Batches grow until the prompt fills the model context window, minus the
+        output budget and a safety margin, or until the expected JSON answer
+        would no longer fit in ``max_tokens``. ``MAX_BATCH_SIZE`` caps both.
+        """
+        context_window = config.MODEL_CONTEXT_WINDOWS.get(self.model, 128_000)
+        fixed_tokens = len(self._encoding.encode(self._batch_system_prompt())) + len(
+            self._encoding.encode(self._batch_template or "")
+        )
+        prompt_budget = (
+            context_window
+            - self._batch_max_tokens()
+            - fixed_tokens
+            - config.CONTEXT_SAFETY_MARGIN
+        )
+        max_complaints = min(
+            config.MAX_BATCH_SIZE,
+            self._batch_max_tokens() // config.BATCH_OUTPUT_TOKENS_PER_COMPLAINT,
+        )
+        return fixed_tokens, prompt_budget, max(1, max_complaints)
+
+    async def _classify_batch_one(
+        self, batch: List[Dict], complaints_text: str, prompt_tokens: int
+    ) -> List[Dict]:
+        """Classify one batch of complaints with a single OpenAI API call
 
-        # Process complaints in chunks to reduce API calls
-        for i in tqdm(
-            range(0, len(complaints), batch_size), desc="Classifying complaints"
-        ):
-            batch = complaints[i : i + batch_size]
+        ``complaints_text`` holds the batch's formatted entries and
+        ``prompt_tokens`` the prompt size, both computed once while packing.
+        """
 
-            # Format multiple complaints into a single prompt
-            complaints_text = "\n\n".join(
-                [
-                    f"ID: {c['complaint_id']}\nTitle: {c.get('complaint_title', '')}\nText: {c.get('complaint_text', '')[:500]}"
-                    for c in batch
-                ]
+        # Load batch prompts from YAML config
+        system_prompt = self._batch_system_prompt()
+        if not self._batch_template:
+            raise ValueError(
+                "Complaint classifier agent must define a batch_user_template message."
             )
 
-            # Load batch prompts from YAML config
-            system_prompt = self.messages.get(
-                "system",
-                "You are a complaint classification system. Return only valid JSON.",
+        user_prompt = format_message(self._batch_template, complaints_text=complaints_text)
+
+        try:
+            # Send batch to OpenAI API (one call for multiple complaints)
+            response = await self._chat_completion(
+                system_prompt,
+                user_prompt,
+                temperature=self.parameters.get("temperature", 0.1),
+                max_tokens=self._batch_max_tokens(),
+                response_format=self._batch_response_format,
+                estimated_tokens=prompt_tokens,
             )
-            batch_template = self.messages.get("batch_user_template")
-            if not batch_template:
-                raise ValueError(
-                    "Complaint classifier agent must define a batch_user_template message."
-                )
+        except RateLimitError:
+            # Still rate limited after retries: let the worker re-queue the batch
+            raise
+        except Exception as e:
+            # If the API call fails for good, mark all complaints as ERROR
+            print(f"Error processing batch: {e}")
+            return [
+                {"complaint_id": c["complaint_id"], "assigned_category": "ERROR"}
+                for c in batch
+            ]
 
-            user_prompt = format_message(
-                batch_template,
-                taxonomy_text=taxonomy_text,
-                complaints_text=complaints_text,
+        # With the schema only a refusal or an answer cut off at max_tokens can
+        # fail to parse; in JSON mode the shape and categories are checked here
+        message = response.choices[0].message
+        try:
+            return [
+                {
+                    "complaint_id": result["complaint_id"],
+                    "assigned_category": self._validate_category(
+                        result["assigned_category"], result["complaint_id"]
+                    ),
+                }
+                for result in orjson.loads(message.content or "")["results"]
+            ]
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            reason = getattr(message, "refusal", None) or response.choices[0].finish_reason
+            print(
+                f"Warning: incomplete batch response ({reason}), classifying {len(batch)} complaints individually"
             )
+            return await self._classify_individually(batch)
 
+    async def _classify_unit(
+        self,
+        unit: List[Dict],
+        complaints_text: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+    ) -> List[Dict]:
+        """Classify one unit of queued work (a batch, or a single complaint)
+
+        Batches come with their prompt text and size from the producer; a unit
+        without them is classified one complaint per call.
+        """
+        if complaints_text is None:
+            return await self._classify_individually(unit)
+
+        batch_results = await self._classify_batch_one(unit, complaints_text, prompt_tokens)
+        categories = {
+            result["complaint_id"]: result["assigned_category"]
+            for result in batch_results
+        }
+
+        # Complaints the model skipped get a second chance one by one
+        missing = [c for c in unit if c["complaint_id"] not in categories]
+        if missing:
+            print(
+                f"Warning: {len(missing)} complaints missing from batch response, classifying individually"
+            )
+            for result in await self._classify_individually(missing):
+                categories[result["complaint_id"]] = result["assigned_category"]
+
+        # Keep the input order
+        return [
+            {
+                "complaint_id": c["complaint_id"],
+                "assigned_category": categories[c["complaint_id"]],
+            }
+            for c in unit
+        ]
+
+    async def _classify_unit_with_requeue(
+        self,
+        unit: List[Dict],
+        complaints_text: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+    ) -> List[Dict]:
+        """Classify a unit, re-queueing it behind the limiter while rate limited
+
+        Rate-limit errors that outlast the per-call retries pause the unit and
+        send it through the limiter again instead of dropping its complaints.
+        """
+        for attempt in range(config.RATE_LIMIT_REQUEUES + 1):
             try:
-                start_time = time.time()
-                
-                # Send batch to OpenAI API (one call for multiple complaints)
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    temperature=self.parameters.get("temperature", 0.1),
-                    max_tokens=self.parameters.get("max_tokens", 1000),
+                return await self._classify_unit(unit, complaints_text, prompt_tokens)
+            except RateLimitError as e:
+                if attempt == config.RATE_LIMIT_REQUEUES:
+                    print(f"Error: still rate limited after re-queueing: {e}")
+                    break
+                print(
+                    f"Rate limited, re-queueing {len(unit)} complaints in {config.RATE_LIMIT_REQUEUE_DELAY}s..."
                 )
-                duration = time.time() - start_time
+                await asyncio.sleep(config.RATE_LIMIT_REQUEUE_DELAY)
 
-                # Track API usage if enabled
-                if self.tracker:
-                    self.tracker.log_call(
-                        input_tokens=response.usage.prompt_tokens,
-                        output_tokens=response.usage.completion_tokens,
-                        duration=duration,
-                    )
+        return [
+            {"complaint_id": c["complaint_id"], "assigned_category": "ERROR"}
+            for c in unit
+        ]
+
+    def _open_checkpoint(self, file_path: str) -> Tuple[BinaryIO, Dict[str, str]]:
+        """Open the JSONL checkpoint for appending and return results already in it
+
+        The first line records a fingerprint of the model, prompts and taxonomy;
+        a checkpoint written under a different one is discarded. Complaints that
+        ended in ERROR are left out so they get retried.
+        """
+        fingerprint = make_cache_key(
+            self.model, orjson.dumps(self.messages).decode(), self._taxonomy_text
+        )
+        done: Dict[str, str] = {}
+
+        if os.path.exists(file_path):
+            with open(file_path, "rb") as f:
+                header = f.readline()
+                try:
+                    resumable = orjson.loads(header).get("fingerprint") == fingerprint
+                except orjson.JSONDecodeError:
+                    resumable = False
+
+                if resumable:
+                    for line in f:
+                        try:
+                            result = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            continue  # Partial line from an interrupted write
+                        if result["assigned_category"] == "ERROR":
+                            done.pop(result["complaint_id"], None)
+                        else:
+                            done[result["complaint_id"]] = result["assigned_category"]
+                    return open(file_path, "ab"), done
 
-                result_text = response.choices[0].message.content.strip()
-
-                # Remove markdown code fences if present
-                if result_text.startswith("```json"):
-                    result_text = result_text[7:]
-                if result_text.startswith("```"):
-                    result_text = result_text[3:]
-                if result_text.endswith("```"):
-                    result_text = result_text[:-3]
-                result_text = result_text.strip()
-
-                # Parse JSON response
-                batch_results = json.loads(result_text)
-
-                # Validate all categories in the batch
-                valid_categories = [cat["category_name"] for cat in self.taxonomy] + [
-                    "OTHER"
-                ]
-                for result in batch_results:
-                    if result["assigned_category"] not in valid_categories:
-                        print(
-                            f"Warning: Invalid category '{result['assigned_category']}' for {result['complaint_id']}, changing to OTHER"
-                        )
-                        result["assigned_category"] = "OTHER"
-
-                results.extend(batch_results)
+            print(
+                f"Warning: {file_path} was written with a different model, prompt or taxonomy - starting over"
+            )
+
+        checkpoint = open(file_path, "wb")
+        checkpoint.write(orjson.dumps({"fingerprint": fingerprint}) + b"\n")
+        return checkpoint, done
+
+    async def classify_all_async(
+        self,
+        complaints: Iterable[Dict],
+        taxonomy: List[Dict],
+        use_batch: bool = False,
+        checkpoint_file: Optional[str] = None,
+    ) -> List[Dict]:
+        """Classify all complaints concurrently (choose between single or batch mode)
+
+        ``complaints`` may be any iterable (e.g. the stream from
+        ``load_complaints``). A producer reads it in chunks, resolves what it can
+        from the exact-match cache and then the semantic cache (near-duplicate
+        complaints), and puts the rest on a bounded queue. Worker tasks drain
+        the queue with chat completion calls, so reading the input overlaps
+        with API dispatch.
 
+        With ``checkpoint_file``, every result is appended to that JSONL file as
+        soon as it is known, and complaints already in it are skipped, so an
+        interrupted run resumes where it stopped.
+        """
+        self._set_taxonomy(taxonomy)
+        self._new_limiters()
+        complaints = iter(complaints)
+
+        checkpoint, done = (
+            self._open_checkpoint(checkpoint_file) if checkpoint_file else (None, {})
+        )
+        if done:
+            print(f"✓ Resuming: {len(done)} complaints already classified in {checkpoint_file}")
+
+        # Use batch mode for efficiency if many complaints (peek, don't consume)
+        head = list(islice(complaints, 21))
+        use_batch = use_batch and len(head) > 20
+        complaints = chain(head, complaints)
+        if use_batch:
+            fixed_tokens, prompt_budget, max_batch_size = self._batch_limits()
+
+        semantic_cache = (
+            self._semantic_cache_for_taxonomy() if self.use_semantic_cache else None
+        )
+        order: List[str] = []
+        categories: Dict[str, str] = {}
+        cache_keys: Dict[str, str] = {}
+        embeddings: Dict[str, List[float]] = {}
+
+        workers = self.max_concurrent_requests
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2 * workers)
+        progress = tqdm(desc="Classifying complaints", unit="complaint")
+
+        async def resolve_from_cache(chunk: List[Dict]) -> List[Dict]:
+            """Answer what the caches can; return the complaints that need the API"""
+
+            # 1) Exact match: same prompt already classified
+            pending = []
+            for complaint in chunk:
+                if self.cache:
+                    key = self._cache_key(complaint)
+                    cache_keys[complaint["complaint_id"]] = key
+                    cached = self.cache.get(key)
+                    if cached is not None:
+                        categories[complaint["complaint_id"]] = cached
+                        continue
+                pending.append(complaint)
+
+            if semantic_cache is None or not pending:
+                return pending
+
+            # 2) Semantic match: paraphrase of an already classified complaint
+            try:
+                vectors = await self._embed([self._complaint_text(c) for c in pending])
             except Exception as e:
-                # If batch fails, mark all complaints as ERROR
-                print(f"Error processing batch: {e}")
-                for c in batch:
-                    results.append(
+                print(f"Warning: semantic cache skipped for {len(pending)} complaints: {e}")
+                return pending
+
+            misses = []
+            for complaint, vector, match in zip(
+                pending, vectors, semantic_cache.lookup(vectors)
+            ):
+                if match is not None:
+                    categories[complaint["complaint_id"]] = match
+                else:
+                    embeddings[complaint["complaint_id"]] = vector
+                    misses.append(complaint)
+            return misses
+
+        def write_checkpoint(results: List[Dict]):
+            """Append results to the checkpoint (one JSON object per line)"""
+            if checkpoint is None or not results:
+                return
+            checkpoint.write(b"".join(orjson.dumps(r) + b"\n" for r in results))
+            checkpoint.flush()
+
+        def record(results: List[Dict]):
+            """Store API results and remember them for future runs (never errors)"""
+            write_checkpoint(results)
+            new_vectors, new_categories = [], []
+            for result in results:
+                complaint_id = result["complaint_id"]
+                category = result["assigned_category"]
+                categories[complaint_id] = category
+                if category == "ERROR":
+                    continue
+                if self.cache:
+                    self.cache.set(cache_keys[complaint_id], category)
+                if complaint_id in embeddings:
+                    new_vectors.append(embeddings.pop(complaint_id))
+                    new_categories.append(category)
+
+            if semantic_cache is not None:
+                semantic_cache.add(new_vectors, new_categories)
+            progress.update(len(results))
+
+        async def produce():
+            # Batch mode packs complaints into units by prompt tokens; each entry
+            # is formatted once here and travels with its unit to the prompt
+            pending: List[Dict] = []
+            pending_entries: List[str] = []
+            pending_tokens = 0
+
+            async def put_pending():
+                await queue.put(
+                    (pending, "\n\n".join(pending_entries), fixed_tokens + pending_tokens)
+                )
+            while True:
+                chunk = list(islice(complaints, config.EMBEDDING_BATCH_SIZE))
+                if not chunk:
+                    break
+                order.extend(c["complaint_id"] for c in chunk)
+
+                # Skip complaints finished by an earlier (interrupted) run
+                fresh = []
+                for complaint in chunk:
+                    if complaint["complaint_id"] in done:
+                        categories[complaint["complaint_id"]] = done[complaint["complaint_id"]]
+                    else:
+                        fresh.append(complaint)
+
+                misses = await resolve_from_cache(fresh)
+                miss_ids = {c["complaint_id"] for c in misses}
+                write_checkpoint(
+                    [
                         {
                             "complaint_id": c["complaint_id"],
-                            "assigned_category": "ERROR",
+                            "assigned_category": categories[c["complaint_id"]],
                         }
-                    )
+                        for c in fresh
+                        if c["complaint_id"] not in miss_ids
+                    ]
+                )
+                progress.update(len(chunk) - len(misses))
+
+                for complaint in misses:
+                    if not use_batch:
+                        await queue.put(([complaint], None, None))
+                        continue
+
+                    entry, tokens = self._batch_entry(complaint)
+                    if pending and (
+                        pending_tokens + tokens > prompt_budget
+                        or len(pending) >= max_batch_size
+                    ):
+                        await put_pending()
+                        pending, pending_entries, pending_tokens = [], [], 0
+                    pending.append(complaint)
+                    pending_entries.append(entry)
+                    pending_tokens += tokens
 
-        return results
+            if pending:
+                await put_pending()
+            for _ in range(workers):
+                await queue.put(None)
+
+        async def consume():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                record(await self._classify_unit_with_requeue(*item))
+
+        self._new_client()
+        try:
+            await asyncio.gather(produce(), *[consume() for _ in range(workers)])
+        finally:
+            progress.close()
+            await self.client.close()
+            if semantic_cache is not None:
+                semantic_cache.save()
+            if checkpoint is not None:
+                checkpoint.close()
+
+        return [
+            {"complaint_id": complaint_id, "assigned_category": categories[complaint_id]}
+            for complaint_id in order
+        ]
 
     def classify_all(
-        self, complaints: List[Dict], taxonomy: List[Dict], use_batch: bool = False
+        self, complaints: Iterable[Dict], taxonomy: List[Dict], use_batch: bool = False
     ) -> List[Dict]:
-        """Classify all complaints (choose between single or batch mode)"""
-        self.taxonomy = taxonomy
+        """Synchronous wrapper around classify_all_async (await that one in Jupyter)"""
+        return run_sync(
+            self.classify_all_async(complaints, taxonomy, use_batch),
+            "classifier.classify_all_async",
+        )
 
-        # Use batch mode for efficiency if many complaints
-        if use_batch and len(complaints) > 20:
-            return self.classify_batch(complaints, batch_size=10)
-        else:
-            # Single-complaint mode (one API call per complaint)
-            results = []
-            for complaint in tqdm(complaints, desc="Classifying complaints"):
-                category = self.classify_complaint(complaint, taxonomy)
-                results.append(
+    async def classify_all_via_batch_api(
+        self, complaints: Iterable[Dict], taxonomy: List[Dict]
+    ) -> List[Dict]:
+        """Classify complaints through the OpenAI Batch API (one request per complaint)
+
+        Half the price of real-time calls, but the job can take up to 24h, so
+        this is meant for offline runs. Complaints found in the response cache
+        are not resubmitted, and the answers are cached for future runs.
+        """
+        self._set_taxonomy(taxonomy)
+        temperature, max_tokens = self._single_parameters()
+
+        order: List[str] = []
+        categories: Dict[str, str] = {}
+        cache_keys: Dict[str, str] = {}
+        requests: List[Tuple[str, Dict]] = []
+
+        for complaint in complaints:
+            complaint_id = complaint["complaint_id"]
+            order.append(complaint_id)
+
+            system_prompt, user_prompt = self._single_prompts(complaint)
+            key = make_cache_key(self.model, system_prompt, user_prompt)
+            cached = self.cache.get(key) if self.cache else None
+            if cached is not None:
+                categories[complaint_id] = cached
+                continue
+
+            cache_keys[complaint_id] = key
+            requests.append(
+                (
+                    complaint_id,
                     {
-                        "complaint_id": complaint["complaint_id"],
-                        "assigned_category": category,
-                    }
+                        "model": self.model,
+                        "messages": [
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt},
+                        ],
+                        "temperature": temperature,
+                        "max_tokens": max_tokens,
+                    },
+                )
+            )
+
+        if requests:
+            print(f"Submitting {len(requests)} complaints to the Batch API ({len(categories)} cached)...")
+            self._new_client()
+            try:
+                bodies = await run_batch(
+                    self.client,
+                    requests,
+                    poll_interval=config.BATCH_API_POLL_INTERVAL,
+                    max_poll_interval=config.BATCH_API_MAX_POLL_INTERVAL,
                 )
-            return results
+            finally:
+                await self.client.close()
+
+            for complaint_id, _ in requests:
+                body = bodies.get(complaint_id)
+                if body is None:
+                    print(f"Error classifying {complaint_id}: batch request failed")
+                    categories[complaint_id] = "ERROR"
+                    continue
+
+                if self.tracker:
+                    self.tracker.log_call(
+                        input_tokens=body["usage"]["prompt_tokens"],
+                        output_tokens=body["usage"]["completion_tokens"],
+                        duration=0.0,  # Not measurable per request in a batch
+                        batch_api=True,
+                    )
+
+                # A refusal comes back with no content: keep going with the rest
+                message = body["choices"][0]["message"]
+                if not message.get("content"):
+                    reason = message.get("refusal") or "empty answer"
+                    print(f"Error classifying {complaint_id}: {reason}")
+                    categories[complaint_id] = "ERROR"
+                    continue
+
+                category = self._validate_category(message["content"].strip(), complaint_id)
+                categories[complaint_id] = category
+                if self.cache:
+                    self.cache.set(cache_keys[complaint_id], category)
+
+        return [
+            {"complaint_id": complaint_id, "assigned_category": categories[complaint_id]}
+            for complaint_id in order
+        ]
 
     def generate_summary(self, results: List[Dict]) -> Dict:
         """Generate classification summary statistics"""
         total = len(results)
-        category_counts = {}
-
-        for result in results:
-            category = result["assigned_category"]
-            category_counts[category] = category_counts.get(category, 0) + 1
+        category_counts = Counter(result["assigned_category"] for result in results)
+        inv_total = 100.0 / total if total else 0.0
 
         summary = {
             "total_complaints": total,
@@ -270,11 +928,9 @@ class ComplaintClassifier:
                 {
                     "category": cat,
                     "count": count,
-                    "percentage": round((count / total) * 100, 2),
+                    "percentage": round(count * inv_total, 2),
                 }
-                for cat, count in sorted(
-                    category_counts.items(), key=lambda x: x[1], reverse=True
-                )
+                for cat, count in category_counts.most_common()
             ],
         }
 
@@ -309,9 +965,7 @@ def run_phase4():
     )
 
     if classifier.tracker:
-        classifier.tracker.start_session(
-            "Phase 4 - Classification", config.OPENAI_MODEL
-        )
+        classifier.tracker.start_session("Phase 4 - Classification", config.OPENAI_MODEL)
 
     print("Loading curated taxonomy...")
     taxonomy = classifier.load_taxonomy(config.CURATED_TAXONOMY_FILE)
@@ -319,12 +973,25 @@ def run_phase4():
     for cat in taxonomy:
         print(f"  - {cat['category_name']}")
 
-    print(f"\nLoading complaints...")
+    print(f"\nStreaming complaints from {config.COMPLAINTS_FILE}...")
     complaints = classifier.load_complaints(config.COMPLAINTS_FILE)
-    print(f"✓ Loaded {len(complaints)} complaints")
 
     print(f"\nClassifying all complaints using OpenAI API ({config.OPENAI_MODEL})...")
-    results = classifier.classify_all(complaints, taxonomy, use_batch=True)
+    os.makedirs(config.OUTPUT_DIR, exist_ok=True)
+    if config.USE_BATCH_API:
+        results = asyncio.run(
+            classifier.classify_all_via_batch_api(complaints, taxonomy)
+        )
+    else:
+        results = asyncio.run(
+            classifier.classify_all_async(
+                complaints,
+                taxonomy,
+                use_batch=True,
+                checkpoint_file=config.CLASSIFICATION_CHECKPOINT_FILE,
+            )
+        )
+    print(f"✓ Classified {len(results)} complaints")
 
     summary = classifier.generate_summary(results)
 
@@ -334,8 +1001,16 @@ def run_phase4():
         "summary": summary,
     }
 
-    with open(config.CLASSIFICATION_RESULTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=2)
+    # Compact JSON for downstream code; indented copy only if asked for
+    with open(config.CLASSIFICATION_RESULTS_FILE, "wb") as f:
+        f.write(orjson.dumps(output_data, option=orjson.OPT_NON_STR_KEYS))
+    if config.PRETTY_JSON:
+        with open(config.CLASSIFICATION_RESULTS_PRETTY_FILE, "wb") as f:
+            f.write(
+                orjson.dumps(
+                    output_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                )
+            )
 
     print(f"\n{'='*60}")
     print("PHASE 4 COMPLETE - DELIVERABLES:")
@@ -356,6 +1031,7 @@ def run_phase4():
             print(f"{'='*60}")
             print(f"Model: {session_data['model']}")
             print(f"API Calls: {len(session_data['calls'])}")
+            print(f"Retries: {session_data.get('retries', 0)}")
             print(f"Input Tokens: {session_data['total_input_tokens']:,}")
             print(f"Output Tokens: {session_data['total_output_tokens']:,}")
             print(f"Total Tokens: {session_data['total_tokens']:,}")
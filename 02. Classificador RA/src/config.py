@@ -6,22 +6,94 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4o-mini"
 
+# Maximum number of concurrent OpenAI requests in Phase 4
+MAX_CONCURRENT_REQUESTS = 50
+
+# Shared HTTP/2 connection pool for OpenAI calls (Phases 2 and 4)
+OPENAI_MAX_CONNECTIONS = MAX_CONCURRENT_REQUESTS
+OPENAI_TIMEOUT = 60.0
+
+# OpenAI account rate limits (requests/min and tokens/min)
+MAX_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_MAX_RPM", "500"))
+MAX_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_MAX_TPM", "200000"))
+
+# Batch classification: complaint text is cut to COMPLAINT_MAX_TOKENS, and batches
+# grow until they fill the model context (minus output budget and margin) or
+# reach MAX_BATCH_SIZE complaints
+COMPLAINT_MAX_TOKENS = 150
+MAX_BATCH_SIZE = 100
+BATCH_OUTPUT_TOKENS_PER_COMPLAINT = 30
+CONTEXT_SAFETY_MARGIN = 2000
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4-turbo": 128_000,
+}
+# Models accepting strict json_schema response formats (Structured Outputs);
+# other models get plain JSON mode
+STRUCTURED_OUTPUT_MODELS = {"gpt-4o-mini", "gpt-4o"}
+
+# Work still rate limited after retries is paused and re-queued this many times
+RATE_LIMIT_REQUEUES = 3
+RATE_LIMIT_REQUEUE_DELAY = 60
+
+# Submit Phases 2 and 4 through the OpenAI Batch API instead: 50% cheaper, results within 24h
+USE_BATCH_API = os.getenv("USE_BATCH_API", "false").lower() == "true"
+BATCH_API_POLL_INTERVAL = 10
+BATCH_API_MAX_POLL_INTERVAL = 300
+
 SHOW_API_USAGE = os.getenv("SHOW_API_USAGE", "true").lower() == "true"
 SHOW_API_USAGE_DETAILS = os.getenv("SHOW_API_USAGE_DETAILS", "false").lower() == "true"
-API_USAGE_LOG_FILE = "output/openai_usage.json"
+API_USAGE_LOG_FILE = "output/openai_usage.jsonl"
 
 RECLAME_AQUI_URL = "https://www.reclameaqui.com.br/empresa/mercedes-benz-cars-e-vans"
 MAX_PAGES = 20
 REQUEST_DELAY = 2
+# Phase 1 fetches pages in waves of this size (requests still start at most once per REQUEST_DELAY)
+SCRAPER_MAX_CONCURRENCY = 5
 
 SAMPLE_SIZE_FOR_DISCOVERY = 200
+# Phase 2 reuses the saved proposed taxonomy when its fingerprint (model, agent
+# prompts, discovery settings and sample) matches; FORCE_REGENERATE=true always calls the API
+# (the response cache is not read, only refreshed with the new answers)
+FORCE_REGENERATE = os.getenv("FORCE_REGENERATE", "false").lower() == "true"
+# Seed for the Phase 2 sample, so reruns analyse the same complaints
+RANDOM_SEED = int(os.getenv("RANDOM_SEED", "42"))
 MIN_CATEGORIES = 6
 MAX_CATEGORIES = 10
+# Phase 2 prompt compression: each sampled complaint's text is capped at this length
+MAX_CHARS_PER_COMPLAINT = 500
+# Expected answer size per proposed category; Phase 2 always leaves room for
+# MAX_CATEGORIES of them when fitting the prompt into the context window
+TAXONOMY_TOKENS_PER_CATEGORY = 200
+
+# Phase 2 map-reduce: the sample is split into up to TAXONOMY_MAP_CHUNKS chunks
+# (of at least TAXONOMY_MIN_CHUNK_SIZE complaints) analysed concurrently, then merged
+TAXONOMY_MAP_CHUNKS = 4
+TAXONOMY_MIN_CHUNK_SIZE = 25
 
 DATA_DIR = "data"
 OUTPUT_DIR = "output"
+CACHE_DIR = ".cache"
+
+# Reuse cached answers for prompts already sent (Phase 2 taxonomies, Phase 4 categories)
+USE_RESPONSE_CACHE = True
+
+# Reuse categories of near-duplicate complaints (cosine similarity of embeddings)
+USE_SEMANTIC_CACHE = True
+SEMANTIC_CACHE_THRESHOLD = 0.92
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 100
+# Texts are cut to this many tokens before embedding (the model takes 8191; the
+# classifier's tokenizer can count fewer tokens than the embedding model's)
+EMBEDDING_MAX_TOKENS = 6000
 
 COMPLAINTS_FILE = os.path.join(DATA_DIR, "complaints_raw.json")
 PROPOSED_TAXONOMY_FILE = os.path.join(OUTPUT_DIR, "proposed_taxonomy.json")
 CURATED_TAXONOMY_FILE = os.path.join(OUTPUT_DIR, "curated_taxonomy.json")
 CLASSIFICATION_RESULTS_FILE = os.path.join(OUTPUT_DIR, "classification_results.json")
+CLASSIFICATION_CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, "classification_results.jsonl")
+CLASSIFICATION_RESULTS_PRETTY_FILE = os.path.join(OUTPUT_DIR, "classification_results_pretty.json")
+
+# Also write an indented copy of the Phase 4 results for manual inspection
+PRETTY_JSON = os.getenv("PRETTY_JSON", "false").lower() == "true"
@@ -0,0 +1,25 @@
+"""OpenAI client factory sharing one pooled HTTP/2 connection."""
+from __future__ import annotations
+
+import httpx
+from openai import AsyncOpenAI
+
+import config
+
+
+def create_async_client(api_key: str, **kwargs) -> AsyncOpenAI:
+    """Build an ``AsyncOpenAI`` client on top of a keep-alive HTTP/2 pool
+
+    Concurrent requests are multiplexed over the same connection instead of
+    paying a TLS handshake each. Extra keyword arguments go to ``AsyncOpenAI``.
+    """
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=config.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=config.OPENAI_MAX_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(config.OPENAI_TIMEOUT),
+        follow_redirects=True,
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, **kwargs)
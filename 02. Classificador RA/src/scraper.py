@@ -1,12 +1,14 @@
+import asyncio
 import re
-import json
 import time
 import os
 from typing import List, Dict, Optional
 from datetime import datetime
-import requests
-from bs4 import BeautifulSoup
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
 from tqdm import tqdm
+from async_utils import run_sync
 try:
     from selenium import webdriver
     from selenium.webdriver.chrome.service import Service
@@ -15,9 +17,130 @@ try:
     SELENIUM_AVAILABLE = True
 except ImportError:
     SELENIUM_AVAILABLE = False
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
 import config
 
 
+# PII patterns, compiled once at import time
+
+# Names (capitalized words in sequence)
+_RE_NAME = re.compile(r'\b[A-Z][a-zÀ-ÿ]+(?:\s+[A-Z][a-zÀ-ÿ]+)+\b')
+
+# CPF (Brazilian SSN): 123.456.789-01
+_RE_CPF = re.compile(r'\b\d{3}\.\d{3}\.\d{3}-\d{2}\b')
+
+# CNPJ (Company ID): 12.345.678/0001-90
+_RE_CNPJ = re.compile(r'\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b')
+
+# Phone numbers with various formats
+_RE_PHONE = re.compile(r'\b(?:\+?55\s?)?(?:\(?\d{2}\)?\s?)?\d{4,5}[-\s]?\d{4}\b')
+
+# Email addresses
+_RE_EMAIL = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+
+# Vehicle license plates
+_RE_PLATE = re.compile(r'\b[A-Z]{3}[-\s]?\d{4}\b')
+
+# Chassis numbers
+_RE_CHASSIS = re.compile(r'\b(?:chassi|chassis)\s*:?\s*\w+\b', re.IGNORECASE)
+
+# Protocol numbers
+_RE_PROTOCOL = re.compile(r'\bprotocolo\s*:?\s*\d+\b', re.IGNORECASE)
+
+# Patterns in substitution priority order, with their placeholder tags
+_PII_RULES = [
+    (_RE_NAME, '[NOME]'),
+    (_RE_CPF, '[CPF]'),
+    (_RE_CNPJ, '[CNPJ]'),
+    (_RE_PHONE, '[TELEFONE]'),
+    (_RE_EMAIL, '[EMAIL]'),
+    (_RE_PLATE, '[PLACA]'),
+    (_RE_CHASSIS, '[CHASSI]'),
+    (_RE_PROTOCOL, '[PROTOCOLO]'),
+]
+
+# Next.js page data: <script id="__NEXT_DATA__" type="application/json">{...}</script>
+_RE_NEXT_DATA = re.compile(r'<script[^>]*\bid=["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>', re.DOTALL)
+
+# HTML cleanup patterns for complaint descriptions
+_RE_HTML_BREAK = re.compile(r'<br\s*/?>')
+_RE_HTML_TAG = re.compile(r'<[^>]+>')
+
+
+# Hyperscan prefilter: each PII pattern is widened so that it matches at least
+# everything Python's ``re`` would (word boundaries dropped, any non-ASCII code
+# point accepted as \d/\w/\s or as a case variant). Hyperscan only decides
+# which rules can fire; the substitutions themselves are always done by ``re``.
+_HS_ESCAPE_CLASSES = {
+    'd': '0-9',
+    'w': '0-9A-Za-z_',
+    's': '\\t\\n\\x0b\\x0c\\r\\x1c-\\x20',
+}
+_HS_NON_ASCII = '\\x{80}-\\x{10FFFF}'
+
+
+def _prefilter_expression(pattern: re.Pattern) -> bytes:
+    """Translate a PII regex into a Hyperscan expression matching a superset of it"""
+    source = pattern.pattern
+    caseless = bool(pattern.flags & re.IGNORECASE)
+    out = []
+    in_class = False
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            escape = source[i + 1]
+            i += 2
+            if escape == 'b':
+                continue  # zero-width, so dropping it only widens the match set
+            if escape in _HS_ESCAPE_CLASSES:
+                body = _HS_ESCAPE_CLASSES[escape] + _HS_NON_ASCII
+                out.append(body if in_class else f'[{body}]')
+            elif escape.isalnum():
+                raise ValueError(f"Unsupported escape \\{escape} in {source!r}")
+            else:
+                out.append('\\' + escape)
+            continue
+        
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif caseless and char.isalpha():
+            if in_class:
+                raise ValueError(f"Unsupported caseless class in {source!r}")
+            # Unicode case folding maps a few non-ASCII letters to ASCII ones (e.g. K)
+            char = f'[{char.lower()}{char.upper()}{_HS_NON_ASCII}]'
+        out.append(char)
+        i += 1
+    return ''.join(out).encode('utf-8')
+
+
+def _compile_hyperscan_database():
+    """Compile the widened PII patterns into one Hyperscan database (one-pass scan)"""
+    database = hyperscan.Database()
+    flags = hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_PREFILTER | hyperscan.HS_FLAG_SINGLEMATCH
+    database.compile(
+        expressions=[_prefilter_expression(pattern) for pattern, _ in _PII_RULES],
+        ids=list(range(len(_PII_RULES))),
+        elements=len(_PII_RULES),
+        flags=[flags] * len(_PII_RULES),
+    )
+    return database
+
+
+_HYPERSCAN_DB = None
+if HYPERSCAN_AVAILABLE:
+    try:
+        _HYPERSCAN_DB = _compile_hyperscan_database()
+    except (hyperscan.error, ValueError):
+        _HYPERSCAN_DB = None
+
+
 class PIIRemover:
     """Remove or mask personally identifiable information (PII) from text for LGPD compliance"""
     
@@ -27,31 +150,41 @@ class PIIRemover:
         if not text:
             return text
         
-        # Replace names (capitalized words in sequence)
-        text = re.sub(r'\b[A-Z][a-zÀ-ÿ]+(?:\s+[A-Z][a-zÀ-ÿ]+)+\b', '[NOME]', text)
-        
-        # Replace CPF (Brazilian SSN): 123.456.789-01
-        text = re.sub(r'\b\d{3}\.\d{3}\.\d{3}-\d{2}\b', '[CPF]', text)
-        
-        # Replace CNPJ (Company ID): 12.345.678/0001-90
-        text = re.sub(r'\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b', '[CNPJ]', text)
+        rules = _PII_RULES
+        if _HYPERSCAN_DB is not None:
+            rules = PIIRemover._candidate_rules(text)
         
-        # Replace phone numbers with various formats
-        text = re.sub(r'\b(?:\+?55\s?)?(?:\(?\d{2}\)?\s?)?\d{4,5}[-\s]?\d{4}\b', '[TELEFONE]', text)
+        for pattern, replacement in rules:
+            text = pattern.sub(replacement, text)
         
-        # Replace email addresses
-        text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '[EMAIL]', text)
-        
-        # Replace vehicle license plates
-        text = re.sub(r'\b[A-Z]{3}[-\s]?\d{4}\b', '[PLACA]', text)
+        return text
+    
+    @staticmethod
+    def _candidate_rules(text: str) -> list:
+        """Rules whose widened pattern occurs in ``text``, in _PII_RULES order
         
-        # Replace chassis numbers
-        text = re.sub(r'\b(?:chassi|chassis)\s*:?\s*\w+\b', '[CHASSI]', text, flags=re.IGNORECASE)
+        Checking the original text is enough: every placeholder is bracketed,
+        and no PII pattern can match across a ``[`` or ``]``, so a substitution
+        never creates a match for a later rule.
+        """
+        hits = set()
         
-        # Replace protocol numbers
-        text = re.sub(r'\bprotocolo\s*:?\s*\d+\b', '[PROTOCOLO]', text, flags=re.IGNORECASE)
+        def on_match(pattern_id, start, end, flags, context):
+            hits.add(pattern_id)
         
-        return text
+        _HYPERSCAN_DB.scan(text.encode('utf-8'), match_event_handler=on_match)
+        return [rule for pattern_id, rule in enumerate(_PII_RULES) if pattern_id in hits]
+
+
+# Browser-like headers for plain HTTP requests (Reclame Aqui blocks default clients)
+_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
+_HTTP_HEADERS = {
+    'User-Agent': _USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+}
+# Shared by the sync and async clients so both paths send the same requests
+_HTTP_CLIENT_OPTIONS = dict(http2=True, headers=_HTTP_HEADERS, timeout=10.0, follow_redirects=True)
 
 
 class ReclameAquiAPIExtractor:
@@ -60,7 +193,9 @@ class ReclameAquiAPIExtractor:
     def __init__(self, base_url: str, delay: float = 2):
         self.base_url = base_url  # Company page URL on Reclame Aqui
         self.delay = delay         # Delay between requests (be respectful to the server)
-        self.driver = None         # Selenium WebDriver instance
+        self.driver = None         # Selenium WebDriver instance (fallback only)
+        # Persistent HTTP/2 client for the sync path, created on first use
+        self._http: Optional[httpx.Client] = None
     
     def _init_driver(self):
         """Initialize headless Chrome browser with Selenium"""
@@ -73,46 +208,170 @@ class ReclameAquiAPIExtractor:
         chrome_options.add_argument('--disable-dev-shm-usage')
         chrome_options.add_argument('--disable-blink-features=AutomationControlled')
         # Mimic a real browser to avoid bot detection
-        chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36')
+        chrome_options.add_argument(f'--user-agent={_USER_AGENT}')
         
         service = Service(ChromeDriverManager().install())
         self.driver = webdriver.Chrome(service=service, options=chrome_options)
     
-    def _close_driver(self):
-        """Clean up: close browser and free resources"""
+    def _close(self):
+        """Clean up: close HTTP client and browser, free resources"""
+        if self._http:
+            self._http.close()
+            self._http = None
         if self.driver:
             self.driver.quit()
+            self.driver = None
+    
+    def _page_url(self, page: int) -> str:
+        """Build URL for the specific page"""
+        return f"{self.base_url}/lista-reclamacoes/?pagina={page}" if page > 1 else f"{self.base_url}/lista-reclamacoes/"
+    
+    def _parse_next_data(self, html: Optional[str]) -> Optional[Dict]:
+        """Find the embedded __NEXT_DATA__ JSON in the page HTML"""
+        if not html:
+            return None
+        
+        # Only one tag is needed, so a regex search beats building a full DOM
+        match = _RE_NEXT_DATA.search(html)
+        if not match:
+            return None
+        
+        # Parse JSON string into Python dict
+        return orjson.loads(match.group(1))
+    
+    def _fetch_html(self, url: str) -> Optional[str]:
+        """Fetch the raw page HTML over HTTP (no browser, no JS execution)"""
+        if self._http is None:
+            # Reused across pages: one TCP+TLS handshake for the whole scrape
+            self._http = httpx.Client(**_HTTP_CLIENT_OPTIONS)
+        
+        try:
+            response = self._http.get(url)
+        except httpx.HTTPError as e:
+            print(f"HTTP request failed for {url}: {e}")
+            return None
+        
+        if response.status_code != 200:
+            print(f"HTTP {response.status_code} for {url}")
+            return None
+        return response.text
+    
+    def _fetch_html_selenium(self, url: str) -> str:
+        """Load the page in headless Chrome (for anti-bot challenges)"""
+        if not self.driver:
+            self._init_driver()
+        
+        self.driver.get(url)
+        time.sleep(3)  # Wait for JavaScript to execute
+        return self.driver.page_source
     
     def extract_next_data(self, page: int = 1) -> Optional[Dict]:
-        """Extract __NEXT_DATA__ JSON embedded in the page HTML (Next.js pattern)"""
+        """Extract __NEXT_DATA__ JSON embedded in the page HTML (Next.js pattern)
+
+        __NEXT_DATA__ is part of the initial HTML, so a plain HTTP request is
+        enough. Selenium is only used when that response doesn't contain it
+        (e.g. a Cloudflare challenge page).
+        """
         try:
-            if not self.driver:
-                self._init_driver()
-            
-            # Build URL for the specific page
-            url = f"{self.base_url}/lista-reclamacoes/?pagina={page}" if page > 1 else f"{self.base_url}/lista-reclamacoes/"
+            url = self._page_url(page)
             print(f"Fetching page {page}...")
-
-            # Load page in browser
-            self.driver.get(url)
-            time.sleep(3)  # Wait for JavaScript to execute
-
-            # Parse HTML and find the embedded JSON data
-            soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-            script_tag = soup.find('script', {'id': '__NEXT_DATA__', 'type': 'application/json'})
-
-            if not script_tag:
+            
+            data = self._parse_next_data(self._fetch_html(url))
+            
+            if data is None and SELENIUM_AVAILABLE:
+                print(f"No __NEXT_DATA__ in HTTP response for page {page}, retrying with Selenium...")
+                data = self._parse_next_data(self._fetch_html_selenium(url))
+            
+            if data is None:
                 print(f"Warning: No __NEXT_DATA__ found on page {page}")
                 return None
             
-            # Parse JSON string into Python dict
-            data = json.loads(script_tag.string)
             return data
         
         except Exception as e:
             print(f"Error extracting data from page {page}: {e}")
             return None
     
+    async def _fetch_html_async(self, client: httpx.AsyncClient, url: str) -> Optional[str]:
+        """Async version of _fetch_html using a shared AsyncClient"""
+        try:
+            response = await client.get(url)
+        except httpx.HTTPError as e:
+            print(f"HTTP request failed for {url}: {e}")
+            return None
+        
+        if response.status_code != 200:
+            print(f"HTTP {response.status_code} for {url}")
+            return None
+        return response.text
+    
+    async def _extract_next_data_async(
+        self,
+        client: httpx.AsyncClient,
+        page: int,
+        limiter: AsyncLimiter,
+        selenium_lock: asyncio.Lock,
+    ) -> Optional[Dict]:
+        """Async version of extract_next_data (concurrent, rate-limited fetch)"""
+        try:
+            url = self._page_url(page)
+            
+            async with limiter:
+                print(f"Fetching page {page}...")
+                data = self._parse_next_data(await self._fetch_html_async(client, url))
+            
+            if data is None and SELENIUM_AVAILABLE:
+                # Only one browser instance: serialize the fallback and run it off the event loop
+                async with selenium_lock:
+                    print(f"No __NEXT_DATA__ in HTTP response for page {page}, retrying with Selenium...")
+                    html = await asyncio.get_running_loop().run_in_executor(
+                        None, self._fetch_html_selenium, url
+                    )
+                data = self._parse_next_data(html)
+            
+            if data is None:
+                print(f"Warning: No __NEXT_DATA__ found on page {page}")
+            return data
+        
+        except Exception as e:
+            print(f"Error extracting data from page {page}: {e}")
+            return None
+    
+    async def _scrape_pages_async(self, max_pages: int) -> List[Dict]:
+        """Fetch pages in waves of SCRAPER_MAX_CONCURRENCY, stopping at the first empty page
+
+        Pages within a wave are fetched concurrently, but requests still start
+        at most once per ``delay`` seconds. The next wave only starts when every
+        page of the current one had complaints, so nothing past the end of the
+        listing is requested.
+        """
+        limiter = AsyncLimiter(max_rate=1, time_period=self.delay)
+        selenium_lock = asyncio.Lock()
+        all_complaints = []
+        
+        async with httpx.AsyncClient(**_HTTP_CLIENT_OPTIONS) as client:
+            for first_page in range(1, max_pages + 1, config.SCRAPER_MAX_CONCURRENCY):
+                pages = range(first_page, min(first_page + config.SCRAPER_MAX_CONCURRENCY, max_pages + 1))
+                wave = await asyncio.gather(*[
+                    self._extract_next_data_async(client, page, limiter, selenium_lock)
+                    for page in pages
+                ])
+                
+                # Pages come back in order; stop at the first page without data
+                for page, data in zip(pages, wave):
+                    if not data:
+                        print(f"Stopping at page {page} - no data returned")
+                        return all_complaints
+                    
+                    complaints = self.parse_complaints_from_data(data, page)
+                    if not complaints:
+                        print(f"Stopping at page {page} - no complaints found")
+                        return all_complaints
+                    
+                    all_complaints.extend(complaints)
+        
+        return all_complaints
+    
     def parse_complaints_from_data(self, data: Dict, page: int) -> List[Dict]:
         """Parse complaints from __NEXT_DATA__ structure"""
         complaints = []
@@ -143,8 +402,8 @@ class ReclameAquiAPIExtractor:
                 description_clean = PIIRemover.clean_text(description)
                 
                 # Remove HTML tags from description
-                description_clean = re.sub(r'<br\s*/?>', ' ', description_clean)
-                description_clean = re.sub(r'<[^>]+>', '', description_clean)
+                description_clean = _RE_HTML_BREAK.sub(' ', description_clean)
+                description_clean = _RE_HTML_TAG.sub('', description_clean)
                 
                 # Translate status
                 status_map = {
@@ -174,34 +433,30 @@ class ReclameAquiAPIExtractor:
             return []
     
     def scrape_all_complaints(self, max_pages: int = config.MAX_PAGES) -> List[Dict]:
-        """Scrape complaints from multiple pages"""
+        """Scrape complaints from multiple pages (fetched concurrently in small waves)
+
+        Inside a running event loop (e.g. Jupyter), await
+        ``scrape_all_complaints_async`` instead.
+        """
+        return run_sync(
+            self.scrape_all_complaints_async(max_pages),
+            "extractor.scrape_all_complaints_async",
+        )
+
+    async def scrape_all_complaints_async(self, max_pages: int = config.MAX_PAGES) -> List[Dict]:
+        """Async version of ``scrape_all_complaints``"""
         try:
-            all_complaints = []
             pages_to_scrape = max_pages if max_pages else 10
             
             print(f"Starting scrape: up to {pages_to_scrape} pages")
             
-            for page in range(1, pages_to_scrape + 1):
-                data = self.extract_next_data(page)
-                if not data:
-                    print(f"Stopping at page {page} - no data returned")
-                    break
-                
-                complaints = self.parse_complaints_from_data(data, page)
-                if not complaints:
-                    print(f"Stopping at page {page} - no complaints found")
-                    break
-                
-                all_complaints.extend(complaints)
-                
-                if page < pages_to_scrape:
-                    time.sleep(self.delay)
+            all_complaints = await self._scrape_pages_async(pages_to_scrape)
             
             print(f"\n✓ Total complaints collected: {len(all_complaints)}")
             return all_complaints
         
         finally:
-            self._close_driver()
+            self._close()
 
 
 def run_phase1():
@@ -213,17 +468,14 @@ def run_phase1():
     os.makedirs(config.DATA_DIR, exist_ok=True)
     
     if not SELENIUM_AVAILABLE:
-        print("ERROR: Selenium is required for this scraper.")
-        print("Install with: pip install selenium webdriver-manager")
-        print("\nAlternatively, use sample data:")
-        print("  python use_sample_data.py")
-        return
+        print("Note: Selenium not installed - pages blocked by anti-bot protection will be skipped.")
+        print("Install with: pip install selenium webdriver-manager\n")
     
     scraper = ReclameAquiAPIExtractor(config.RECLAME_AQUI_URL, config.REQUEST_DELAY)
     complaints = scraper.scrape_all_complaints(max_pages=config.MAX_PAGES)
     
-    with open(config.COMPLAINTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(complaints, f, ensure_ascii=False, indent=2)
+    with open(config.COMPLAINTS_FILE, 'wb') as f:
+        f.write(orjson.dumps(complaints, option=orjson.OPT_INDENT_2))
     
     print(f"\n{'='*60}")
     print("PHASE 1 COMPLETE - DELIVERABLES:")
@@ -1,14 +1,64 @@
-import json
+import asyncio
+import hashlib
 import random
 import os
+import re
+import sys
 import time
-from typing import List, Dict, Optional
-from openai import OpenAI
+from typing import List, Dict, Optional, Tuple
+import ijson
+import orjson
+import tiktoken
 import config
+from batch_api import run_batch
+from cache import ResponseCache, make_cache_key
+from openai_client import create_async_client
 from usage_tracker import OpenAIUsageTracker
-from agent_loader import load_agent_config, format_message
+from agent_loader import load_agent_config, format_message, partial_format
+from async_utils import run_sync
 
 
+# Runs of whitespace (newlines, tabs, repeated spaces) collapse to one space
+_RE_WHITESPACE = re.compile(r'\s+')
+
+# Complaints whose first normalized characters match are treated as duplicates
+_DEDUP_PREFIX_CHARS = 200
+
+# Structured output: the API guarantees answers matching this schema
+_TAXONOMY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "taxonomy",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "categories": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "category_name": {"type": "string"},
+                            "category_description": {"type": "string"},
+                            "representative_examples": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                            },
+                        },
+                        "required": ["category_name", "category_description", "representative_examples"],
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": ["categories"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Placeholder used to split the user template around the complaint sample
+_SAMPLE_MARKER = '\x00complaints_sample\x00'
+
 class ThemeDiscovery:
     """Discover recurring themes in complaints using OpenAI API"""
     
@@ -18,9 +68,13 @@ class ThemeDiscovery:
     model: Optional[str] = None,
         track_usage: bool = False,
         agent_name: str = "theme_discovery",
+        use_cache: bool = config.USE_RESPONSE_CACHE,
+        refresh_cache: bool = False,
     ):
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=api_key)
+        # Async OpenAI client (map calls run concurrently over one HTTP/2
+        # connection). Its pool binds to one event loop, so each run opens its own
+        self.api_key = api_key
+        self.client = None
         
         # Load agent configuration from YAML file
         self.agent_config = load_agent_config(agent_name)
@@ -32,96 +86,494 @@ class ThemeDiscovery:
         # Load parameters (temperature, max_tokens, etc.) from YAML
         self.parameters = self.agent_config.get("parameters", {})
         
-        # Optional: track API usage for cost monitoring
-        self.tracker = OpenAIUsageTracker(config.API_USAGE_LOG_FILE) if track_usage else None
-    
-    def load_complaints(self, file_path: str) -> List[Dict]:
-        """Load complaints from JSON file"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    
-    def sample_complaints(self, complaints: List[Dict], sample_size: int) -> List[Dict]:
-        """Select a representative random sample of complaints for analysis"""
-        if len(complaints) <= sample_size:
-            return complaints
+        # Tokenizer used to check the prompt fits the context before sending
+        try:
+            self._encoding = tiktoken.encoding_for_model(self.model)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("o200k_base")
         
-        return random.sample(complaints, sample_size)
-    
-    def generate_taxonomy(self, complaints_sample: List[Dict]) -> Dict:
-        """Call OpenAI API to discover themes and generate proposed taxonomy"""
-
-        # Format sample complaints as text for the LLM
-        complaints_text = "\n\n---\n\n".join([
-            f"Complaint {c['complaint_id']}:\nTitle: {c['complaint_title']}\nText: {c['complaint_text']}"
-            for c in complaints_sample if c.get('complaint_text')
-        ])
-
-        # Load prompts from YAML config
+        # Render the static parts of the prompts once. Everything before the
+        # complaint sample is identical across calls (and runs), so the API's
+        # prompt cache can reuse it; nothing volatile may go into the prefix.
         messages = self.agent_config.get("messages", {})
-        system_prompt = messages.get(
+        self._system_prompt = messages.get(
             "system", "You are an expert automotive CX analyst. Return only valid JSON."
         )
         user_template = messages.get("user_template")
         if not user_template:
             raise ValueError("The theme discovery agent must define a user_template message.")
-
-        # Insert sample into the prompt template
-        user_prompt = format_message(
+        self._instruction_prefix, self._instruction_suffix = format_message(
             user_template,
             min_categories=config.MIN_CATEGORIES,
             max_categories=config.MAX_CATEGORIES,
-            complaints_sample=complaints_text,  # Truncate to avoid token limits
+            complaints_sample=_SAMPLE_MARKER,
+        ).split(_SAMPLE_MARKER, 1)
+        self._reduce_template = messages.get("reduce_user_template")
+        if self._reduce_template:
+            self._reduce_template = partial_format(
+                self._reduce_template,
+                min_categories=config.MIN_CATEGORIES,
+                max_categories=config.MAX_CATEGORIES,
+            )
+        
+        # Optional: track API usage for cost monitoring
+        self.tracker = OpenAIUsageTracker(config.API_USAGE_LOG_FILE) if track_usage else None
+        
+        # Optional: reuse answers for identical prompts (e.g. reruns with the same seed).
+        # With refresh_cache every prompt goes to the API and overwrites its entry
+        self.cache = (
+            ResponseCache(os.path.join(config.CACHE_DIR, "theme_discovery"))
+            if use_cache
+            else None
         )
+        self.refresh_cache = refresh_cache
+        
+        # Latest parsed version of each complaints file (path -> (mtime, complaints)),
+        # so re-reads are free until the file changes
+        self._complaints_cache: Dict[str, Tuple[float, List[Dict]]] = {}
+    
+    def load_complaints(self, file_path: str) -> List[Dict]:
+        """Load complaints from JSON file (cached until the file changes)
 
-        start_time = time.time()
+        Only the latest version of each file is kept, and every call returns a
+        new list (the complaint dicts themselves are shared).
+        """
+        path = os.path.abspath(file_path)
+        mtime = os.path.getmtime(path)
+        cached = self._complaints_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = self._complaints_cache[path] = (mtime, orjson.loads(f.read()))
+        return list(cached[1])
+    
+    def sample_complaints(self, complaints: List[Dict], sample_size: int) -> List[Dict]:
+        """Select a representative random sample of complaints for analysis
+
+        Seeded with ``RANDOM_SEED`` so reruns pick the same sample (and hit the cache).
+        """
+        if len(complaints) <= sample_size:
+            return list(complaints)
         
-        # Call OpenAI API to analyze complaints and discover themes
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},   
+        return random.Random(config.RANDOM_SEED).sample(complaints, sample_size)
+    
+    def stream_sample(self, file_path: str, sample_size: int) -> Tuple[List[Dict], int]:
+        """Reservoir-sample complaints straight from the JSON file
+
+        Parses the array incrementally (Algorithm R), so only ``sample_size``
+        complaints are ever held in memory. Returns the sample and the total
+        number of complaints in the file.
+        """
+        rng = random.Random(config.RANDOM_SEED)
+        reservoir: List[Dict] = []
+        count = 0
+        with open(file_path, 'rb') as f:
+            for count, complaint in enumerate(ijson.items(f, 'item'), 1):
+                if count <= sample_size:
+                    reservoir.append(complaint)
+                else:
+                    j = rng.randint(0, count - 1)
+                    if j < sample_size:
+                        reservoir[j] = complaint
+        return reservoir, count
+    
+    @staticmethod
+    def _compress_complaint(complaint: Dict, max_chars: int = config.MAX_CHARS_PER_COMPLAINT) -> str:
+        """Collapse whitespace in the complaint text and cap its length"""
+        return _RE_WHITESPACE.sub(' ', complaint['complaint_text']).strip()[:max_chars]
+    
+    def _build_prompts(self, complaints_sample: List[Dict]) -> Tuple[str, str]:
+        """Build the (system, user) prompts asking for a taxonomy of the sample"""
+
+        # Format sample complaints as text for the LLM, compressed and without
+        # near-duplicates (they add tokens but no new themes)
+        entries = []
+        seen = set()
+        for c in complaints_sample:
+            if not c.get('complaint_text'):
+                continue
+            
+            text = self._compress_complaint(c)
+            fingerprint = hashlib.sha1(text[:_DEDUP_PREFIX_CHARS].lower().encode('utf-8')).digest()
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            
+            title = _RE_WHITESPACE.sub(' ', c['complaint_title']).strip()
+            entries.append(f"Complaint {c['complaint_id']}:\nTitle: {title}\nText: {text}")
+        complaints_text = "\n\n---\n\n".join(entries)
+
+        # Only the sample varies between calls; the cached prefix stays byte-identical
+        user_prompt = self._instruction_prefix + complaints_text + self._instruction_suffix
+        return self._system_prompt, user_prompt
+
+    def _count_tokens(self, system_prompt: str, user_prompt: str) -> int:
+        """Prompt size in tokens, as the model will see it"""
+        return len(self._encoding.encode(system_prompt)) + len(self._encoding.encode(user_prompt))
+    
+    def _chat_body(self, system_prompt: str, user_prompt: str, input_tokens: int) -> Dict:
+        """Chat completion parameters, with ``max_tokens`` capped at what the context leaves"""
+        context_window = config.MODEL_CONTEXT_WINDOWS.get(self.model, 128_000)
+        max_tokens = min(
+            self.parameters.get("max_tokens", 3000),
+            context_window - input_tokens - config.CONTEXT_SAFETY_MARGIN,
+        )
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            temperature=self.parameters.get("temperature", 0.3),
-            max_tokens=self.parameters.get("max_tokens", 3000),
+            "temperature": self.parameters.get("temperature", 0.3),
+            "max_tokens": max_tokens,
+            "response_format": (
+                _TAXONOMY_RESPONSE_FORMAT
+                if self.model in config.STRUCTURED_OUTPUT_MODELS
+                else {"type": "json_object"}
+            ),
+        }
+    
+    def _request_body(self, complaints_sample: List[Dict]) -> Tuple[Dict, int]:
+        """Request proposing a taxonomy for (part of) the sample
+
+        Counts the prompt with tiktoken before sending. If it leaves no room
+        for the expected answer in the model context, complaints are dropped
+        from the end of the sample until it does; ``max_tokens`` is then capped
+        at what is actually left. Returns (body, estimated input tokens).
+        """
+        context_window = config.MODEL_CONTEXT_WINDOWS.get(self.model, 128_000)
+        min_output_tokens = config.MAX_CATEGORIES * config.TAXONOMY_TOKENS_PER_CATEGORY
+        input_budget = context_window - config.CONTEXT_SAFETY_MARGIN - min_output_tokens
+        
+        system_prompt, user_prompt = self._build_prompts(complaints_sample)
+        input_tokens = self._count_tokens(system_prompt, user_prompt)
+        
+        sample = complaints_sample
+        while input_tokens > input_budget and len(sample) > 1:
+            # Drop ~10% per step: one complaint at a time is needlessly slow
+            sample = sample[: len(sample) - max(1, len(sample) // 10)]
+            system_prompt, user_prompt = self._build_prompts(sample)
+            input_tokens = self._count_tokens(system_prompt, user_prompt)
+        if len(sample) < len(complaints_sample):
+            print(
+                f"Warning: prompt too long for {self.model}, "
+                f"using {len(sample)} of {len(complaints_sample)} sampled complaints"
+            )
+        
+        return self._chat_body(system_prompt, user_prompt, input_tokens), input_tokens
+    
+    def _reduce_body(self, partials: List[List[Dict]]) -> Tuple[Dict, int]:
+        """Request merging per-chunk taxonomies into one (no raw complaints)"""
+        if not self._reduce_template:
+            raise ValueError("The theme discovery agent must define a reduce_user_template message.")
+        
+        partials_text = "\n\n".join(
+            f"Proposal {i}:\n{orjson.dumps(categories, option=orjson.OPT_INDENT_2).decode()}"
+            for i, categories in enumerate(partials, 1)
         )
-        duration = time.time() - start_time
+        user_prompt = format_message(self._reduce_template, partial_taxonomies=partials_text)
+        input_tokens = self._count_tokens(self._system_prompt, user_prompt)
+        return self._chat_body(self._system_prompt, user_prompt, input_tokens), input_tokens
+    
+    @staticmethod
+    def _parse_categories(
+        result_text: Optional[str], refusal: Optional[str] = None, finish_reason: str = "stop"
+    ) -> List[Dict]:
+        """Extract the category list from an answer
+
+        Raises ValueError if the model refused, the answer was cut off at
+        ``max_tokens`` or (in plain JSON mode) it has no ``categories`` list.
+        """
+        if refusal:
+            raise ValueError(f"the model refused ({refusal})")
+        if finish_reason == "length":
+            raise ValueError("the answer was cut off at max_tokens")
+        try:
+            categories = orjson.loads(result_text or "")["categories"]
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            categories = None
+        if not isinstance(categories, list):
+            raise ValueError("the answer is not a JSON object with a 'categories' list")
+        return categories
+    
+    def fingerprint(self, complaints_sample: List[Dict]) -> str:
+        """Hash of everything a taxonomy for this sample depends on
+
+        Covers the model, the agent definition (prompts and parameters), the
+        discovery settings and the sampled texts, so a changed seed, sample
+        size or model - also when set through the environment - changes it.
+        """
+        settings = orjson.dumps({
+            "agent": self.agent_config,
+            "random_seed": config.RANDOM_SEED,
+            "sample_size": config.SAMPLE_SIZE_FOR_DISCOVERY,
+            "categories": [config.MIN_CATEGORIES, config.MAX_CATEGORIES],
+            "max_chars_per_complaint": config.MAX_CHARS_PER_COMPLAINT,
+            "map_chunks": [config.TAXONOMY_MAP_CHUNKS, config.TAXONOMY_MIN_CHUNK_SIZE],
+        }).decode()
+        sample_text = "\x00".join(c.get('complaint_text') or '' for c in complaints_sample)
+        return make_cache_key(self.model, settings, sample_text)
+    
+    def _taxonomy_result(
+        self, categories: List[Dict], complaints_sample: List[Dict], total_count: Optional[int]
+    ) -> Dict:
+        """Wrap the proposed categories with metadata"""
+        return {
+            "sample_size": len(complaints_sample),
+            "total_complaints": total_count if total_count is not None else len(complaints_sample),
+            "proposed_categories": categories,
+            "status": "AWAITING_HUMAN_CURATION",
+            "fingerprint": self.fingerprint(complaints_sample),
+        }
+    
+    def _split_sample(self, complaints_sample: List[Dict]) -> List[List[Dict]]:
+        """Split the sample into disjoint, similarly sized chunks for the map step"""
+        chunks = max(1, min(
+            config.TAXONOMY_MAP_CHUNKS,
+            len(complaints_sample) // config.TAXONOMY_MIN_CHUNK_SIZE,
+        ))
+        return [complaints_sample[i::chunks] for i in range(chunks)]
+    
+    async def _complete(
+        self, body: Dict, estimated_input_tokens: int, semaphore: asyncio.Semaphore
+    ) -> Tuple[Optional[str], Optional[str], str]:
+        """Send one real-time chat completion and track its usage
+
+        Returns the answer as (content, refusal, finish_reason).
+        """
+        async with semaphore:
+            start_time = time.time()
+            response = await self.client.chat.completions.create(**body)
+            duration = time.time() - start_time
         
         # Track API usage if enabled
         if self.tracker:
             self.tracker.log_call(
                 input_tokens=response.usage.prompt_tokens,
                 output_tokens=response.usage.completion_tokens,
-                duration=duration
+                duration=duration,
+                estimated_input_tokens=estimated_input_tokens,
             )
+        choice = response.choices[0]
+        return choice.message.content, getattr(choice.message, "refusal", None), choice.finish_reason
+    
+    def _cache_key(self, body: Dict) -> str:
+        """Cache key for a request: model plus system and user prompts"""
+        return make_cache_key(self.model, body["messages"][0]["content"], body["messages"][1]["content"])
+    
+    async def _categories(self, body: Dict, estimated_input_tokens: int, semaphore: asyncio.Semaphore) -> List[Dict]:
+        """Categories for a request: from the cache, or from the API (then cached)
+
+        Raises ValueError for unusable answers (see ``_parse_categories``).
+        """
+        key = self._cache_key(body)
+        if self.cache and not self.refresh_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._parse_categories(cached)
         
-        # Extract response text
-        result_text = response.content.strip() if hasattr(response, 'content') else response.choices[0].message.content.strip()
+        result_text, refusal, finish_reason = await self._complete(body, estimated_input_tokens, semaphore)
+        categories = self._parse_categories(result_text, refusal, finish_reason)
+        if self.cache:
+            self.cache.set(key, result_text)  # Only answers that parsed
+        return categories
+    
+    async def _map_one(self, chunk: List[Dict], semaphore: asyncio.Semaphore) -> Optional[List[Dict]]:
+        """Map step: propose a taxonomy for one chunk of the sample (None if unusable)"""
+        body, estimated_input_tokens = self._request_body(chunk)
+        try:
+            return await self._categories(body, estimated_input_tokens, semaphore)
+        except ValueError as e:
+            print(f"Warning: skipping a sample chunk of {len(chunk)} complaints: {e}")
+            return None
+    
+    async def _reduce(self, partials: List[List[Dict]], semaphore: asyncio.Semaphore) -> List[Dict]:
+        """Reduce step: merge the per-chunk taxonomies into the final one"""
+        if not partials:
+            raise RuntimeError("No usable taxonomy answer for any sample chunk")
+        if len(partials) == 1:
+            return partials[0]
+        body, estimated_input_tokens = self._reduce_body(partials)
+        try:
+            return await self._categories(body, estimated_input_tokens, semaphore)
+        except ValueError as e:
+            raise RuntimeError(f"Could not merge the chunk taxonomies: {e}") from e
+    
+    async def _discover_async(self, complaints_sample: List[Dict]) -> List[Dict]:
+        """Map the sample chunks concurrently, then reduce them to one taxonomy"""
+        semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_REQUESTS)
+        partials = await asyncio.gather(*[
+            self._map_one(chunk, semaphore) for chunk in self._split_sample(complaints_sample)
+        ])
+        return await self._reduce([p for p in partials if p is not None], semaphore)
+    
+    async def _discover_batch_async(self, complaints_sample: List[Dict]) -> List[Dict]:
+        """Run the map step as one Batch API job, then reduce in real time
+
+        Chunks whose answer is already cached are not resubmitted.
+        """
+        partials = []
+        requests = []
+        estimates = {}
+        for i, chunk in enumerate(self._split_sample(complaints_sample), 1):
+            body, estimates[f"taxonomy-{i}"] = self._request_body(chunk)
+            cached = (
+                self.cache.get(self._cache_key(body))
+                if self.cache and not self.refresh_cache
+                else None
+            )
+            if cached is not None:
+                partials.append(self._parse_categories(cached))
+            else:
+                requests.append((f"taxonomy-{i}", body))
         
-        # Remove markdown code fences if present
-        if result_text.startswith("```json"):
-            result_text = result_text[7:]
-        if result_text.startswith("```"):
-            result_text = result_text[3:]
-        if result_text.endswith("```"):
-            result_text = result_text[:-3]
-        result_text = result_text.strip()
+        bodies = await run_batch(
+            self.client,
+            requests,
+            poll_interval=config.BATCH_API_POLL_INTERVAL,
+            max_poll_interval=config.BATCH_API_MAX_POLL_INTERVAL,
+        ) if requests else {}
         
-        # Parse JSON taxonomy
-        taxonomy = json.loads(result_text)
+        for custom_id, body in requests:
+            response = bodies.get(custom_id)
+            if response is None:
+                print(f"Warning: Batch API request {custom_id} failed, merging the other chunks")
+                continue
+            
+            # Track API usage from the batch result line
+            if self.tracker:
+                self.tracker.log_call(
+                    input_tokens=response["usage"]["prompt_tokens"],
+                    output_tokens=response["usage"]["completion_tokens"],
+                    duration=0.0,  # Not measurable per request in a batch
+                    estimated_input_tokens=estimates[custom_id],
+                    batch_api=True,
+                )
+            choice = response["choices"][0]
+            result_text = choice["message"].get("content")
+            try:
+                categories = self._parse_categories(
+                    result_text, choice["message"].get("refusal"), choice.get("finish_reason")
+                )
+            except ValueError as e:
+                print(f"Warning: skipping Batch API result {custom_id}: {e}")
+                continue
+            partials.append(categories)
+            if self.cache:
+                self.cache.set(self._cache_key(body), result_text)
         
-        # Return structured taxonomy with metadata
-        return {
-            "sample_size": len(complaints_sample),
-            "total_complaints": len(self.load_complaints(config.COMPLAINTS_FILE)),
-            "proposed_categories": taxonomy,
-            "status": "AWAITING_HUMAN_CURATION"
-        }
+        # The merge prompt is small: not worth waiting for a second batch job
+        return await self._reduce(partials, asyncio.Semaphore(1))
+
+    def generate_taxonomy(
+        self,
+        complaints_sample: List[Dict],
+        total_count: Optional[int] = None,
+        use_batch_api: bool = False,
+    ) -> Dict:
+        """Call OpenAI API to discover themes and generate proposed taxonomy
+
+        The sample is split into ``TAXONOMY_MAP_CHUNKS`` chunks whose taxonomies
+        are proposed concurrently (map) and then merged by one more call over
+        the proposed categories only (reduce).
+
+        ``total_count`` is the size of the full corpus the sample was drawn
+        from (recorded as metadata; defaults to the sample size). With
+        ``use_batch_api`` the request goes through the Batch API instead
+        (see ``generate_taxonomy_batch``). Inside a running event loop (e.g.
+        Jupyter), await ``generate_taxonomy_async`` instead.
+        """
+        return run_sync(
+            self.generate_taxonomy_async(complaints_sample, total_count, use_batch_api),
+            "discovery.generate_taxonomy_async",
+        )
+
+    async def generate_taxonomy_async(
+        self,
+        complaints_sample: List[Dict],
+        total_count: Optional[int] = None,
+        use_batch_api: bool = False,
+    ) -> Dict:
+        """Async version of ``generate_taxonomy``"""
+        self.client = create_async_client(self.api_key)
+        try:
+            if use_batch_api:
+                categories = await self._discover_batch_async(complaints_sample)
+            else:
+                categories = await self._discover_async(complaints_sample)
+        finally:
+            await self.client.close()
+        return self._taxonomy_result(categories, complaints_sample, total_count)
+
+    def generate_taxonomy_batch(
+        self, complaints_sample: List[Dict], total_count: Optional[int] = None
+    ) -> Dict:
+        """Discover themes through the OpenAI Batch API (50% cheaper, up to 24h)
+
+        Blocks while polling the batch job, so use it for non-interactive runs.
+        Only the map step is batched; the small reduce call runs in real time.
+        """
+        return run_sync(
+            self.generate_taxonomy_async(complaints_sample, total_count, use_batch_api=True),
+            "discovery.generate_taxonomy_async",
+        )
     
     def save_taxonomy(self, taxonomy: Dict, file_path: str):
-        """Save proposed taxonomy to JSON file"""
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(taxonomy, f, ensure_ascii=False, indent=2)
+        """Save proposed taxonomy to JSON file
+
+        Written to a temporary file first and swapped in with ``os.replace``, so
+        an interrupted run never leaves a truncated taxonomy behind.
+        """
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(taxonomy, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        os.replace(tmp_path, file_path)
+
+
+def _load_matching_taxonomy(taxonomy_file: str, fingerprint: str) -> Optional[Dict]:
+    """The saved taxonomy if it was generated from the same inputs, else None"""
+    if not os.path.exists(taxonomy_file):
+        return None
+    try:
+        with open(taxonomy_file, 'rb') as f:
+            taxonomy = orjson.loads(f.read())
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(taxonomy, dict) or taxonomy.get('fingerprint') != fingerprint:
+        return None
+    return taxonomy
+
+
+def _deliverables_report(taxonomy: Dict) -> List[str]:
+    """Report lines listing the proposed categories and the curation steps"""
+    buf = [
+        f"\n{'='*60}",
+        "PHASE 2 COMPLETE - DELIVERABLES:",
+        f"{'='*60}\n",
+    ]
+    
+    for idx, category in enumerate(taxonomy['proposed_categories'], 1):
+        buf.append(f"{idx}. {category['category_name']}")
+        buf.append(f"   Description: {category['category_description']}")
+        buf.append(f"   Examples:")
+        for example in category['representative_examples']:
+            buf.append(f"   - {example}")
+        buf.append("")
+    
+    buf.append(f"{'='*60}")
+    buf.append(f"✓ Proposed taxonomy saved to: {config.PROPOSED_TAXONOMY_FILE}")
+    buf.append(f"✓ Sample size: {taxonomy['sample_size']} complaints")
+    buf.append(f"✓ Total categories: {len(taxonomy['proposed_categories'])}")
+    buf.append(f"\n{'='*60}")
+    buf.append("⚠️  AWAITING HUMAN CURATION")
+    buf.append("DO NOT USE THESE CATEGORIES FOR FULL DATASET CLASSIFICATION YET")
+    buf.append(f"{'='*60}")
+    buf.append(f"\nNext steps:")
+    buf.append(f"1. Review {config.PROPOSED_TAXONOMY_FILE}")
+    buf.append(f"2. Merge, rename, or refine categories as needed")
+    buf.append(f"3. Save final taxonomy to: {config.CURATED_TAXONOMY_FILE}")
+    buf.append(f"4. Run Phase 4 (classifier.py) with curated taxonomy")
+    buf.append(f"{'='*60}\n")
+    return buf
 
 
 def run_phase2():
@@ -142,72 +594,67 @@ def run_phase2():
     
     os.makedirs(config.OUTPUT_DIR, exist_ok=True)
     
-    discovery = ThemeDiscovery(config.OPENAI_API_KEY, config.OPENAI_MODEL, track_usage=config.SHOW_API_USAGE)
+    discovery = ThemeDiscovery(
+        config.OPENAI_API_KEY,
+        config.OPENAI_MODEL,
+        track_usage=config.SHOW_API_USAGE,
+        refresh_cache=config.FORCE_REGENERATE,
+    )
     
-    if discovery.tracker:
-        discovery.tracker.start_session('Phase 2 - Theme Discovery', config.OPENAI_MODEL)
+    # Stream the file so only the sample is kept in memory
+    print(f"Sampling {config.SAMPLE_SIZE_FOR_DISCOVERY} complaints for analysis...")
+    sample, total_count = discovery.stream_sample(
+        config.COMPLAINTS_FILE, config.SAMPLE_SIZE_FOR_DISCOVERY
+    )
+    print(f"✓ Selected {len(sample)} of {total_count} complaints")
     
-    print("Loading complaints...")
-    complaints = discovery.load_complaints(config.COMPLAINTS_FILE)
-    print(f"✓ Loaded {len(complaints)} complaints")
+    # Same sample, model, prompts and settings as the last run: reuse its taxonomy
+    if not config.FORCE_REGENERATE:
+        taxonomy = _load_matching_taxonomy(config.PROPOSED_TAXONOMY_FILE, discovery.fingerprint(sample))
+        if taxonomy is not None:
+            print("✓ Using the saved taxonomy, generated from the same inputs (set FORCE_REGENERATE=true to rebuild)")
+            sys.stdout.write("\n".join(_deliverables_report(taxonomy)) + "\n")
+            sys.stdout.flush()
+            return taxonomy
     
-    print(f"\nSampling {config.SAMPLE_SIZE_FOR_DISCOVERY} complaints for analysis...")
-    sample = discovery.sample_complaints(complaints, config.SAMPLE_SIZE_FOR_DISCOVERY)
-    print(f"✓ Selected {len(sample)} complaints")
+    if discovery.tracker:
+        discovery.tracker.start_session('Phase 2 - Theme Discovery', config.OPENAI_MODEL)
     
     print(f"\nCalling OpenAI API ({config.OPENAI_MODEL}) to discover themes...")
-    taxonomy = discovery.generate_taxonomy(sample)
+    taxonomy = discovery.generate_taxonomy(
+        sample, total_count=total_count, use_batch_api=config.USE_BATCH_API
+    )
     print(f"✓ Generated {len(taxonomy['proposed_categories'])} categories")
     
     discovery.save_taxonomy(taxonomy, config.PROPOSED_TAXONOMY_FILE)
     
+    # Build the whole report and write it at once (no interleaving, one flush)
+    buf = []
     if discovery.tracker and config.SHOW_API_USAGE:
         session_data = discovery.tracker.end_session()
         if session_data:
-            print(f"\n{'='*60}")
-            print(f"OPENAI API USAGE - PHASE 2")
-            print(f"{'='*60}")
-            print(f"Model: {session_data['model']}")
-            print(f"API Calls: {len(session_data['calls'])}")
-            print(f"Input Tokens: {session_data['total_input_tokens']:,}")
-            print(f"Output Tokens: {session_data['total_output_tokens']:,}")
-            print(f"Total Tokens: {session_data['total_tokens']:,}")
-            print(f"Estimated Cost: ${session_data['estimated_cost_usd']:.4f} USD")
+            buf.append(f"\n{'='*60}")
+            buf.append(f"OPENAI API USAGE - PHASE 2")
+            buf.append(f"{'='*60}")
+            buf.append(f"Model: {session_data['model']}")
+            buf.append(f"API Calls: {len(session_data['calls'])}")
+            buf.append(f"Input Tokens: {session_data['total_input_tokens']:,}")
+            buf.append(f"Output Tokens: {session_data['total_output_tokens']:,}")
+            buf.append(f"Total Tokens: {session_data['total_tokens']:,}")
+            buf.append(f"Estimated Cost: ${session_data['estimated_cost_usd']:.4f} USD")
             if config.SHOW_API_USAGE_DETAILS and session_data['calls']:
-                print(f"\nDetailed Calls:")
+                buf.append(f"\nDetailed Calls:")
                 for i, call in enumerate(session_data['calls'], 1):
-                    print(f"  Call {i}: {call['input_tokens']} in + {call['output_tokens']} out = {call['total_tokens']} tokens ({call['duration_seconds']}s)")
-            print(f"{'='*60}\n")
+                    buf.append(f"  Call {i}: {call['input_tokens']} in + {call['output_tokens']} out = {call['total_tokens']} tokens ({call['duration_seconds']}s)")
+            buf.append(f"{'='*60}\n")
     elif discovery.tracker:
         discovery.tracker.end_session()
     
-    print(f"\n{'='*60}")
-    print("PHASE 2 COMPLETE - DELIVERABLES:")
-    print(f"{'='*60}\n")
+    buf.extend(_deliverables_report(taxonomy))
     
-    for idx, category in enumerate(taxonomy['proposed_categories'], 1):
-        print(f"{idx}. {category['category_name']}")
-        print(f"   Description: {category['category_description']}")
-        print(f"   Examples:")
-        for example in category['representative_examples']:
-            print(f"   - {example}")
-        print()
-    
-    print(f"{'='*60}")
-    print(f"✓ Proposed taxonomy saved to: {config.PROPOSED_TAXONOMY_FILE}")
-    print(f"✓ Sample size: {taxonomy['sample_size']} complaints")
-    print(f"✓ Total categories: {len(taxonomy['proposed_categories'])}")
-    print(f"\n{'='*60}")
-    print("⚠️  AWAITING HUMAN CURATION")
-    print("DO NOT USE THESE CATEGORIES FOR FULL DATASET CLASSIFICATION YET")
-    print(f"{'='*60}")
-    print(f"\nNext steps:")
-    print(f"1. Review {config.PROPOSED_TAXONOMY_FILE}")
-    print(f"2. Merge, rename, or refine categories as needed")
-    print(f"3. Save final taxonomy to: {config.CURATED_TAXONOMY_FILE}")
-    print(f"4. Run Phase 4 (classifier.py) with curated taxonomy")
-    print(f"{'='*60}\n")
-
+    sys.stdout.write("\n".join(buf) + "\n")
+    sys.stdout.flush()
+    return taxonomy
 
 if __name__ == "__main__":
     run_phase2()
@@ -1,9 +1,133 @@
-import json
+import sys
+import threading
 import time
+from collections import defaultdict
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 from datetime import datetime
 import os
 
+import orjson
+
+
+def _format_ts(ts_ns: int) -> str:
+    """ISO-format a ``time.time_ns()`` timestamp in local time"""
+    seconds, ns = divmod(ts_ns, 1_000_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=ns // 1000).isoformat()
+
+
+def _parse_ts(timestamp: str) -> int:
+    """Inverse of :func:`_format_ts` (0 for missing/invalid timestamps)"""
+    try:
+        dt = datetime.fromisoformat(timestamp)
+        return int(dt.replace(microsecond=0).timestamp()) * 1_000_000_000 + dt.microsecond * 1000
+    except (TypeError, ValueError):
+        return 0
+
+
+@dataclass(slots=True)
+class Call:
+    """One API call; timestamps stay raw until serialization"""
+    ts_ns: int
+    input_tokens: int
+    output_tokens: int
+    duration: float
+    estimated_input_tokens: Optional[int] = None
+    batch_api: bool = False
+    model: Optional[str] = None  # When it differs from the session's (e.g. embeddings)
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+    
+    @property
+    def duration_seconds(self) -> float:
+        return round(self.duration, 2)
+    
+    def to_dict(self) -> Dict:
+        data = {
+            'timestamp': _format_ts(self.ts_ns),
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'total_tokens': self.total_tokens,
+            'duration_seconds': self.duration_seconds,
+        }
+        if self.estimated_input_tokens is not None:
+            data['estimated_input_tokens'] = self.estimated_input_tokens
+        if self.batch_api:
+            data['batch_api'] = True
+        if self.model is not None:
+            data['model'] = self.model
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Call':
+        return cls(
+            ts_ns=_parse_ts(data.get('timestamp')),
+            input_tokens=data.get('input_tokens', 0),
+            output_tokens=data.get('output_tokens', 0),
+            duration=data.get('duration_seconds', 0.0),
+            estimated_input_tokens=data.get('estimated_input_tokens'),
+            batch_api=data.get('batch_api', False),
+            model=data.get('model'),
+        )
+
+
+@dataclass(slots=True)
+class Session:
+    """One tracked run of a phase, with running token totals
+
+    ``batch_api`` is set once any call went through the Batch API.
+    """
+    phase: str
+    model: str
+    batch_api: bool = False
+    start_ns: int = field(default_factory=time.time_ns)
+    calls: List[Call] = field(default_factory=list)
+    retries: int = 0
+    total_input_tokens: int = 0
+    total_output_tokens: int = 0
+    duration_seconds: float = 0
+    estimated_cost_usd: float = 0.0
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.total_input_tokens + self.total_output_tokens
+    
+    @property
+    def start_datetime(self) -> str:
+        return _format_ts(self.start_ns)
+    
+    def to_dict(self) -> Dict:
+        return {
+            'phase': self.phase,
+            'model': self.model,
+            'batch_api': self.batch_api,
+            'start_datetime': self.start_datetime,
+            'calls': [call.to_dict() for call in self.calls],
+            'retries': self.retries,
+            'total_input_tokens': self.total_input_tokens,
+            'total_output_tokens': self.total_output_tokens,
+            'total_tokens': self.total_tokens,
+            'duration_seconds': self.duration_seconds,
+            'estimated_cost_usd': self.estimated_cost_usd,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Session':
+        return cls(
+            phase=data.get('phase', ''),
+            model=data.get('model', ''),
+            batch_api=data.get('batch_api', False),
+            start_ns=_parse_ts(data.get('start_datetime')),
+            calls=[Call.from_dict(call) for call in data.get('calls', [])],
+            retries=data.get('retries', 0),
+            total_input_tokens=data.get('total_input_tokens', 0),
+            total_output_tokens=data.get('total_output_tokens', 0),
+            duration_seconds=data.get('duration_seconds', 0),
+            estimated_cost_usd=data.get('estimated_cost_usd', 0.0),
+        )
+
 
 class OpenAIUsageTracker:
     """Track OpenAI API usage: tokens, time, and estimated costs"""
@@ -21,93 +145,174 @@ class OpenAIUsageTracker:
         'gpt-4-turbo': {
             'input': 10.00,
             'output': 30.00
+        },
+        'text-embedding-3-small': {
+            'input': 0.02,
+            'output': 0.0
+        },
+        'text-embedding-3-large': {
+            'input': 0.13,
+            'output': 0.0
         }
     }
     
-    def __init__(self, log_file: str = "output/openai_usage.json"):
+    # The Batch API bills tokens at half the real-time price
+    BATCH_API_DISCOUNT = 0.5
+    
+    def __init__(self, log_file: str = "output/openai_usage.jsonl"):
         self.log_file = log_file
-        self.sessions = []
-        self.current_session = None
+        self.sessions: List[Session] = []
+        self.current_session: Optional[Session] = None
+        # Calls may be logged concurrently (async tasks, worker threads)
+        self._lock = threading.Lock()
+        # Pricing resolved per model on first use
+        self._pricing_for: Dict[str, Dict[str, float]] = {}
         self._load_history()
     
     def _load_history(self):
-        """Load previous usage history"""
-        if os.path.exists(self.log_file):
+        """Load previous usage history (one session per line)
+
+        A history in the old single-document format (``{"sessions": [...]}``),
+        either in ``log_file`` itself or in the ``.json`` file next to it, is
+        converted to JSONL once. Lines that do not decode (e.g. a partial line
+        from an interrupted append) are skipped.
+        """
+        legacy_file = os.path.splitext(self.log_file)[0] + '.json'
+        if not os.path.exists(self.log_file):
+            if legacy_file != self.log_file and os.path.exists(legacy_file):
+                self._migrate_history(legacy_file)
+            return
+        
+        try:
+            with open(self.log_file, 'rb') as f:
+                lines = [line for line in f.read().splitlines() if line.strip()]
+        except Exception:
+            self.sessions = []
+            return
+        if not lines:
+            return
+        
+        # JSONL starts with a complete session object; the old format does not
+        try:
+            first = orjson.loads(lines[0])
+        except orjson.JSONDecodeError:
+            first = None
+        if not isinstance(first, dict) or 'sessions' in first:
+            self._migrate_history(self.log_file)
+            return
+        
+        for line in lines:
             try:
-                with open(self.log_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.sessions = data.get('sessions', [])
-            except Exception:
-                self.sessions = []
-    
-    def _save_history(self):
-        """Save usage history to file"""
+                self.sessions.append(Session.from_dict(orjson.loads(line)))
+            except orjson.JSONDecodeError:
+                continue  # Partial line from an interrupted write
+    
+    def _migrate_history(self, legacy_file: str):
+        """Convert an old ``{"sessions": [...]}`` history file to JSONL"""
+        try:
+            with open(legacy_file, 'rb') as f:
+                self.sessions = [
+                    Session.from_dict(session) for session in orjson.loads(f.read()).get('sessions', [])
+                ]
+        except Exception:
+            self.sessions = []
+            return
+        
+        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+        # Rewrite via a temporary file so a crash mid-migration keeps the old history
+        tmp_path = self.log_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(orjson.dumps(session.to_dict()) + b'\n' for session in self.sessions))
+        os.replace(tmp_path, self.log_file)
+    
+    def _pricing(self, model: str) -> Dict[str, float]:
+        """Per-1M-token prices for ``model`` (gpt-4o-mini prices if unknown)"""
+        pricing = self._pricing_for.get(model)
+        if pricing is None:
+            pricing = self._pricing_for[model] = self.PRICING.get(model, self.PRICING['gpt-4o-mini'])
+        return pricing
+    
+    def _append_session(self, session_data: Dict):
+        """Append one finished session to the history file (O(1), no rewrite)"""
         os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'sessions': self.sessions,
-                'last_updated': datetime.now().isoformat()
-            }, f, indent=2, ensure_ascii=False)
+        with open(self.log_file, 'a+b') as f:
+            # Terminate a partial last line left by an interrupted write first
+            prefix = b''
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    prefix = b'\n'
+            f.write(prefix + orjson.dumps(session_data) + b'\n')
     
     def start_session(self, phase: str, model: str):
         """Start tracking a new session"""
-        self.current_session = {
-            'phase': phase,
-            'model': model,
-            'start_time': time.time(),
-            'start_datetime': datetime.now().isoformat(),
-            'calls': [],
-            'total_input_tokens': 0,
-            'total_output_tokens': 0,
-            'total_tokens': 0,
-            'duration_seconds': 0,
-            'estimated_cost_usd': 0.0
-        }
+        self.current_session = Session(phase=phase, model=model)
     
-    def log_call(self, input_tokens: int, output_tokens: int, duration: float):
-        """Log a single API call"""
+    def log_call(
+        self,
+        input_tokens: int,
+        output_tokens: int,
+        duration: float,
+        estimated_input_tokens: Optional[int] = None,
+        batch_api: bool = False,
+        model: Optional[str] = None,
+    ):
+        """Log a single API call (optionally with the pre-flight tiktoken estimate)
+
+        ``batch_api`` marks calls billed at the Batch API discount, and ``model``
+        calls priced as another model than the session's (e.g. embeddings).
+
+        Only raw values are stored here (hot path); timestamps are formatted and
+        durations rounded when the session is serialized.
+        """
         if not self.current_session:
             return
         
-        call_data = {
-            'timestamp': datetime.now().isoformat(),
-            'input_tokens': input_tokens,
-            'output_tokens': output_tokens,
-            'total_tokens': input_tokens + output_tokens,
-            'duration_seconds': round(duration, 2)
-        }
+        call = Call(
+            time.time_ns(), input_tokens, output_tokens, duration,
+            estimated_input_tokens, batch_api, model,
+        )
         
-        self.current_session['calls'].append(call_data)
-        self.current_session['total_input_tokens'] += input_tokens
-        self.current_session['total_output_tokens'] += output_tokens
-        self.current_session['total_tokens'] += (input_tokens + output_tokens)
+        with self._lock:
+            self.current_session.calls.append(call)
+            self.current_session.total_input_tokens += input_tokens
+            self.current_session.total_output_tokens += output_tokens
+            self.current_session.batch_api |= batch_api
     
-    def end_session(self):
-        """End current session and calculate totals"""
+    def log_retry(self):
+        """Log a retried API call (e.g. after a rate limit or timeout)"""
         if not self.current_session:
             return
         
-        self.current_session['duration_seconds'] = round(
-            time.time() - self.current_session['start_time'], 2
-        )
-        
-        # Calculate cost
-        model = self.current_session['model']
-        pricing = self.PRICING.get(model, self.PRICING['gpt-4o-mini'])
+        with self._lock:
+            self.current_session.retries += 1
+    
+    def end_session(self) -> Optional[Dict]:
+        """End current session, calculate totals and return it as a plain dict"""
+        session = self.current_session
+        if not session:
+            return
         
-        input_cost = (self.current_session['total_input_tokens'] / 1_000_000) * pricing['input']
-        output_cost = (self.current_session['total_output_tokens'] / 1_000_000) * pricing['output']
-        self.current_session['estimated_cost_usd'] = round(input_cost + output_cost, 4)
+        session.duration_seconds = round((time.time_ns() - session.start_ns) / 1e9, 2)
         
-        # Remove start_time (not JSON serializable in readable format)
-        del self.current_session['start_time']
+        # Calculate cost call by call: Batch API calls are discounted (real-time
+        # ones, e.g. the Phase 2 merge after a batched map step, are billed in
+        # full) and embedding calls have their own prices
+        cost = 0.0
+        for call in session.calls:
+            pricing = self._pricing(call.model or session.model)
+            call_cost = (
+                call.input_tokens * pricing['input'] + call.output_tokens * pricing['output']
+            ) / 1_000_000
+            cost += call_cost * self.BATCH_API_DISCOUNT if call.batch_api else call_cost
+        session.estimated_cost_usd = round(cost, 4)
         
-        self.sessions.append(self.current_session)
-        self._save_history()
+        session_data = session.to_dict()
+        self.sessions.append(session)
+        self._append_session(session_data)
         
-        session = self.current_session
         self.current_session = None
-        return session
+        return session_data
     
     def get_summary(self, show_details: bool = False) -> str:
         """Get formatted summary of current session"""
@@ -117,22 +322,23 @@ class OpenAIUsageTracker:
         session = self.current_session
         lines = [
             f"\n{'='*60}",
-            f"OPENAI API USAGE - {session['phase'].upper()}",
+            f"OPENAI API USAGE - {session.phase.upper()}",
             f"{'='*60}",
-            f"Model: {session['model']}",
-            f"API Calls: {len(session['calls'])}",
-            f"Input Tokens: {session['total_input_tokens']:,}",
-            f"Output Tokens: {session['total_output_tokens']:,}",
-            f"Total Tokens: {session['total_tokens']:,}",
-            f"Estimated Cost: ${session.get('estimated_cost_usd', 0.0):.4f} USD"
+            f"Model: {session.model}",
+            f"API Calls: {len(session.calls)}",
+            f"Retries: {session.retries}",
+            f"Input Tokens: {session.total_input_tokens:,}",
+            f"Output Tokens: {session.total_output_tokens:,}",
+            f"Total Tokens: {session.total_tokens:,}",
+            f"Estimated Cost: ${session.estimated_cost_usd:.4f} USD"
         ]
         
-        if show_details and session['calls']:
+        if show_details and session.calls:
             lines.append(f"\nDetailed Calls:")
-            for i, call in enumerate(session['calls'], 1):
+            for i, call in enumerate(session.calls, 1):
                 lines.append(
-                    f"  Call {i}: {call['input_tokens']} in + {call['output_tokens']} out "
-                    f"= {call['total_tokens']} tokens ({call['duration_seconds']}s)"
+                    f"  Call {i}: {call.input_tokens} in + {call.output_tokens} out "
+                    f"= {call.total_tokens} tokens ({call.duration_seconds}s)"
                 )
         
         lines.append(f"{'='*60}\n")
@@ -146,46 +352,47 @@ class OpenAIUsageTracker:
             'total_output_tokens': 0,
             'total_tokens': 0,
             'total_cost_usd': 0.0,
-            'by_phase': {}
         }
+        by_phase = defaultdict(lambda: {'sessions': 0, 'tokens': 0, 'cost_usd': 0.0})
         
         for session in self.sessions:
-            total['total_input_tokens'] += session['total_input_tokens']
-            total['total_output_tokens'] += session['total_output_tokens']
-            total['total_tokens'] += session['total_tokens']
-            total['total_cost_usd'] += session.get('estimated_cost_usd', 0.0)
+            cost = session.estimated_cost_usd
+            total['total_input_tokens'] += session.total_input_tokens
+            total['total_output_tokens'] += session.total_output_tokens
+            total['total_tokens'] += session.total_tokens
+            total['total_cost_usd'] += cost
             
-            phase = session['phase']
-            if phase not in total['by_phase']:
-                total['by_phase'][phase] = {
-                    'sessions': 0,
-                    'tokens': 0,
-                    'cost_usd': 0.0
-                }
-            total['by_phase'][phase]['sessions'] += 1
-            total['by_phase'][phase]['tokens'] += session['total_tokens']
-            total['by_phase'][phase]['cost_usd'] += session.get('estimated_cost_usd', 0.0)
+            phase = by_phase[session.phase]
+            phase['sessions'] += 1
+            phase['tokens'] += session.total_tokens
+            phase['cost_usd'] += cost
         
         total['total_cost_usd'] = round(total['total_cost_usd'], 4)
+        total['by_phase'] = dict(by_phase)
         return total
     
     def print_total_usage(self):
         """Print total usage summary"""
         total = self.get_total_usage()
         
-        print(f"\n{'='*60}")
-        print("TOTAL OPENAI API USAGE (ALL TIME)")
-        print(f"{'='*60}")
-        print(f"Total Sessions: {total['total_sessions']}")
-        print(f"Total Tokens: {total['total_tokens']:,}")
-        print(f"  Input: {total['total_input_tokens']:,}")
-        print(f"  Output: {total['total_output_tokens']:,}")
-        print(f"Total Estimated Cost: ${total['total_cost_usd']:.4f} USD")
+        # Build the whole report and write it at once (no interleaving, one flush)
+        buf = [
+            f"\n{'='*60}",
+            "TOTAL OPENAI API USAGE (ALL TIME)",
+            f"{'='*60}",
+            f"Total Sessions: {total['total_sessions']}",
+            f"Total Tokens: {total['total_tokens']:,}",
+            f"  Input: {total['total_input_tokens']:,}",
+            f"  Output: {total['total_output_tokens']:,}",
+            f"Total Estimated Cost: ${total['total_cost_usd']:.4f} USD",
+        ]
         
         if total['by_phase']:
-            print(f"\nBy Phase:")
+            buf.append(f"\nBy Phase:")
             for phase, data in total['by_phase'].items():
-                print(f"  {phase}: {data['sessions']} sessions, "
-                      f"{data['tokens']:,} tokens, ${data['cost_usd']:.4f}")
+                buf.append(f"  {phase}: {data['sessions']} sessions, "
+                           f"{data['tokens']:,} tokens, ${data['cost_usd']:.4f}")
         
-        print(f"{'='*60}\n")
+        buf.append(f"{'='*60}\n")
+        sys.stdout.write("\n".join(buf) + "\n")
+        sys.stdout.flush()
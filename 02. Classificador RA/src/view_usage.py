@@ -21,19 +21,25 @@ def main():
     tracker.print_total_usage()
     
     if show_details:
-        print(f"\n{'='*60}")
-        print("DETAILED SESSION HISTORY")
-        print(f"{'='*60}\n")
+        # One write for the whole history instead of a print per line
+        buf = [
+            f"\n{'='*60}",
+            "DETAILED SESSION HISTORY",
+            f"{'='*60}\n",
+        ]
         
         for i, session in enumerate(tracker.sessions, 1):
-            print(f"Session {i}: {session['phase']}")
-            print(f"  Date: {session['start_datetime']}")
-            print(f"  Model: {session['model']}")
-            print(f"  API Calls: {len(session['calls'])}")
-            print(f"  Tokens: {session['total_input_tokens']:,} in + {session['total_output_tokens']:,} out = {session['total_tokens']:,} total")
-            print(f"  Duration: {session['duration_seconds']}s")
-            print(f"  Cost: ${session['estimated_cost_usd']:.4f} USD")
-            print()
+            buf.append(f"Session {i}: {session.phase}")
+            buf.append(f"  Date: {session.start_datetime}")
+            buf.append(f"  Model: {session.model}")
+            buf.append(f"  API Calls: {len(session.calls)}")
+            buf.append(f"  Tokens: {session.total_input_tokens:,} in + {session.total_output_tokens:,} out = {session.total_tokens:,} total")
+            buf.append(f"  Duration: {session.duration_seconds}s")
+            buf.append(f"  Cost: ${session.estimated_cost_usd:.4f} USD")
+            buf.append("")
+        
+        sys.stdout.write("\n".join(buf) + "\n")
+        sys.stdout.flush()
 
 
 if __name__ == "__main__":
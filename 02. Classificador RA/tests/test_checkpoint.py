@@ -0,0 +1,126 @@
+"""Phase 4 checkpoint: interrupted runs resume without re-classifying finished complaints."""
+import asyncio
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import classifier  # noqa: E402
+import config  # noqa: E402
+from classifier import ComplaintClassifier  # noqa: E402
+
+TAXONOMY = [
+    {"category_name": "Entrega", "category_description": "Atrasos na entrega"},
+    {"category_name": "Garantia", "category_description": "Reparos em garantia"},
+]
+
+
+class _WhitespaceEncoding:
+    """Offline stand-in for a tiktoken encoding (one token per word)"""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+class _StubClient:
+    """Answers every complaint with "Entrega", except the IDs listed in ``fail``"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.classified = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, messages, **kwargs):
+        complaint_id = re.search(r"texto (C\d+)", messages[-1]["content"]).group(1)
+        self.classified.append(complaint_id)
+        if complaint_id in self.fail:
+            raise ValueError("unexpected answer")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Entrega"), finish_reason="stop")],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=1),
+        )
+
+    async def close(self):
+        pass
+
+
+def _complaints(count):
+    return [
+        {"complaint_id": f"C{i}", "complaint_title": "Reclamação", "complaint_text": f"texto C{i}"}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """Classify complaints with a stub client; returns (results, IDs sent to the API)"""
+    monkeypatch.setattr(classifier.tiktoken, "encoding_for_model", lambda model: _WhitespaceEncoding())
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "cache"))
+    checkpoint_file = str(tmp_path / "results.jsonl")
+
+    def _run(complaints, taxonomy=TAXONOMY, fail=(), use_cache=False):
+        client = _StubClient(fail)
+        monkeypatch.setattr(classifier, "create_async_client", lambda *args, **kwargs: client)
+        complaint_classifier = ComplaintClassifier(
+            "test-key", track_usage=False, use_cache=use_cache, use_semantic_cache=False
+        )
+        results = asyncio.run(
+            complaint_classifier.classify_all_async(
+                complaints, taxonomy, checkpoint_file=checkpoint_file
+            )
+        )
+        return results, client.classified
+
+    _run.checkpoint_file = checkpoint_file
+    return _run
+
+
+def _checkpoint_ids(checkpoint_file):
+    with open(checkpoint_file, "rb") as f:
+        return [orjson.loads(line)["complaint_id"] for line in f.read().splitlines()[1:]]
+
+
+def test_resume_skips_finished_and_retries_errors(run):
+    # Interrupted run: only 4 complaints got through, C2 failed, and the
+    # last write was cut mid-line
+    results, classified = run(_complaints(4), fail={"C2"})
+    assert [r["assigned_category"] for r in results] == ["Entrega", "Entrega", "ERROR", "Entrega"]
+    assert sorted(classified) == ["C0", "C1", "C2", "C3"]
+    with open(run.checkpoint_file, "ab") as f:
+        f.write(b'{"complaint_id": "C4", "assig')
+
+    results, classified = run(_complaints(6))
+    assert sorted(classified) == ["C2", "C4", "C5"]
+    assert results == [{"complaint_id": f"C{i}", "assigned_category": "Entrega"} for i in range(6)]
+
+
+def test_checkpoint_from_another_taxonomy_is_discarded(run):
+    run(_complaints(3))
+
+    other_taxonomy = TAXONOMY + [{"category_name": "Peças", "category_description": "Falta de peças"}]
+    results, classified = run(_complaints(3), taxonomy=other_taxonomy)
+    assert sorted(classified) == ["C0", "C1", "C2"]
+    assert sorted(_checkpoint_ids(run.checkpoint_file)) == ["C0", "C1", "C2"]
+
+
+def test_cache_hits_are_checkpointed(run):
+    run(_complaints(3), use_cache=True)
+    os.remove(run.checkpoint_file)
+
+    # Answered from the response cache, but still written to the new checkpoint
+    results, classified = run(_complaints(5), use_cache=True)
+    assert sorted(classified) == ["C3", "C4"]
+    assert sorted(_checkpoint_ids(run.checkpoint_file)) == ["C0", "C1", "C2", "C3", "C4"]
+
+    # So a resumed run needs neither the API nor the cache
+    results, classified = run(_complaints(5))
+    assert classified == []
+    assert [r["assigned_category"] for r in results] == ["Entrega"] * 5
@@ -0,0 +1,49 @@
+"""PII scrubbing: the Hyperscan prefilter must give exactly the ``re`` result."""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import scraper  # noqa: E402
+from scraper import PIIRemover, _PII_RULES  # noqa: E402
+
+
+def _clean_text_re(text):
+    for pattern, replacement in _PII_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+CASES = [
+    ("Falei com João\xa0Silva", "Falei com [NOME]"),
+    ("Maria José", "[NOME]"),
+    ("Atendido por Rosângela Conceição ontem", "Atendido por [NOME] ontem"),
+    ("Contato:\xa0(11)\xa098765-4321", "Contato:\xa0([TELEFONE]"),
+    ("CPF 123.456.789-01 e CNPJ 12.345.678/0001-90", "CPF [CPF] e CNPJ [CNPJ]"),
+    ("Placa ABC\xa01234, chassi:\xa0WDD123", "Placa [PLACA], [CHASSI]"),
+    ("CHAſſI 9BW e protocolo\xa0123", "[CHASSI] e [PROTOCOLO]"),
+    ("Falei com Araújo Lima: eder@example.com", "Falei com [NOME]: [EMAIL]"),
+]
+
+
+@pytest.mark.parametrize("text,expected", CASES)
+def test_re_path(text, expected):
+    assert _clean_text_re(text) == expected
+
+
+@pytest.mark.skipif(scraper._HYPERSCAN_DB is None, reason="hyperscan not installed")
+@pytest.mark.parametrize("text,expected", CASES)
+def test_hyperscan_matches_re(text, expected):
+    assert PIIRemover.clean_text(text) == expected
+
+
+@pytest.mark.skipif(scraper._HYPERSCAN_DB is None, reason="hyperscan not installed")
+def test_hyperscan_matches_re_fuzz():
+    alphabet = "aAbBéÉçÇãJjoOsSkKıİſK0123456789 \xa0 \t-./:@()+_[]" + "chassiprotocolo"
+    rng = random.Random(0)
+    for _ in range(20_000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 40)))
+        assert PIIRemover.clean_text(text) == _clean_text_re(text), repr(text)